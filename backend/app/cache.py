@@ -0,0 +1,40 @@
+"""
+快取工具模組
+提供跨模組共用的簡易 LRU 快取
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class LRUCache:
+    """
+    簡易 LRU 快取（可選 TTL），供跨請求共用的結果使用
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key) -> Any:
+        """取得快取值，不存在或已過期則返回 None"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        stored_at, value = item
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """寫入快取，超過上限時淘汰最久未使用的項目"""
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
@@ -5,9 +5,17 @@
 
 import logging
 import os
+import re
+import random
 import asyncio
 import aiohttp
-from typing import Dict, Optional
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.cache import LRUCache
+from app.dedup import normalize_url
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +27,14 @@ except ImportError:
     TRAFILATURA_AVAILABLE = False
     logger.warning("trafilatura 未安裝，將使用基礎 HTML 解析")
 
+# 嘗試導入 selectolax（C 實作的 HTML 解析器，供基礎解析使用）
+try:
+    from selectolax.parser import HTMLParser as SelectolaxHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+    logger.info("selectolax 未安裝，基礎解析將使用 html.parser")
+
 # 檢查 Playwright 是否啟用（透過環境變數）
 ENABLE_PLAYWRIGHT = os.getenv('ENABLE_PLAYWRIGHT', 'false').lower() == 'true'
 
@@ -27,12 +43,166 @@ PLAYWRIGHT_AVAILABLE = False
 if ENABLE_PLAYWRIGHT:
     try:
         from playwright.async_api import async_playwright
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
         PLAYWRIGHT_AVAILABLE = True
         logger.info("Playwright 已啟用")
     except ImportError:
         logger.warning("ENABLE_PLAYWRIGHT=true 但 playwright 未安裝")
 
 
+# 基礎解析時略過內容的標籤
+SKIP_TAGS = ['script', 'style', 'noscript', 'svg', 'iframe']
+
+# 常見的頁面元素文字（清理正文時移除）
+NOISE_PATTERNS = [
+    r'訂閱電子報',
+    r'加入會員',
+    r'免費註冊',
+    r'分享到',
+    r'Advertisement',
+    r'Sponsored',
+    r'Loading\.\.\.',
+    r'Please\s+wait',
+]
+
+# 預先編譯的正規表示式
+_NOISE_RE = re.compile('|'.join(NOISE_PATTERNS), re.IGNORECASE)
+# 空白正規化與雜訊移除合併為單次掃描：group 1 為空白，其餘為雜訊
+_WS_NOISE_RE = re.compile(r'(\s+)|' + _NOISE_RE.pattern, re.IGNORECASE)
+
+
+def _ws_noise_repl(match: re.Match) -> str:
+    """空白換成單一空格，雜訊文字直接移除"""
+    return ' ' if match.group(1) else ''
+
+
+# 以下快取皆以去重用的正規化 URL（normalize_url）為 key，與去重步驟認定的同一篇文章一致
+
+# Google News 跳轉連結 -> 實際文章 URL（跨請求共用）
+_resolved_urls = LRUCache(maxsize=1024)
+
+# trafilatura 抽取結果（跨請求共用，1 小時內重複的文章直接回傳）
+_extract_cache = LRUCache(maxsize=1024, ttl=3600)
+
+
+class _TextExtractor(HTMLParser):
+    """
+    html.parser 版本的文字抽取器（selectolax 不可用時使用）
+    單次走訪 HTML，略過 SKIP_TAGS 內的內容
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def get_text(self) -> str:
+        return ' '.join(self._parts)
+
+
+def _html_to_text(html: str) -> str:
+    """
+    移除 HTML 標籤，只保留文字（單次走訪）
+    """
+    if SELECTOLAX_AVAILABLE:
+        tree = SelectolaxHTMLParser(html)
+        tree.strip_tags(SKIP_TAGS)
+        root = tree.body or tree.root
+        return root.text(separator=' ', strip=True) if root else ''
+
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.get_text()
+
+
+class PlaywrightPool:
+    """
+    Playwright 瀏覽器池
+
+    整個程序共用同一個 Chromium，每次抓取只建立新的 browser context，
+    用完關閉 context，避免每篇文章都重新啟動瀏覽器
+    """
+
+    # 同時開啟的 context 上限
+    MAX_CONTEXTS = 4
+
+    BROWSER_ARGS = [
+        '--no-sandbox',
+        '--disable-setuid-sandbox',
+        '--disable-dev-shm-usage',
+        '--disable-gpu'
+    ]
+
+    def __init__(self):
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+        self._context_sem = asyncio.Semaphore(self.MAX_CONTEXTS)
+
+    async def _get_browser(self):
+        """
+        取得共用的瀏覽器（首次使用或瀏覽器中斷時才啟動）
+        """
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True,
+                    args=self.BROWSER_ARGS
+                )
+                logger.info("Playwright 瀏覽器已啟動")
+            return self._browser
+
+    @asynccontextmanager
+    async def page(self, **context_options):
+        """
+        在新的 context 中開啟頁面，離開時只關閉 context
+
+        Args:
+            context_options: 傳給 browser.new_context 的參數
+        """
+        async with self._context_sem:
+            browser = await self._get_browser()
+            context = await browser.new_context(**context_options)
+            try:
+                yield await context.new_page()
+            finally:
+                await context.close()
+
+    async def shutdown(self):
+        """
+        關閉瀏覽器與 Playwright（應用程式結束時呼叫）
+        """
+        async with self._lock:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception as e:
+                    logger.warning(f"關閉 Playwright 瀏覽器失敗: {e}")
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+
+# 全域共用的 Playwright 瀏覽器池
+playwright_pool = PlaywrightPool()
+
+
 class ContentExtractor:
     """
     文章正文抽取器
@@ -50,17 +220,87 @@ class ContentExtractor:
 
     # HTTP 請求設定
     REQUEST_TIMEOUT = 20  # 秒
+    CONNECTION_LIMIT = 64  # 連線池總上限
+    CONNECTION_LIMIT_PER_HOST = 4  # 單一網域連線上限
     USER_AGENT = (
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
         '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
     )
 
-    def __init__(self):
+    # 並發限制（避免對同一網站造成過大壓力）
+    MAX_CONCURRENT_PER_HOST = 4  # 同一網域同時進行的抓取數
+    MAX_CONCURRENT_FETCHES = 32  # 全域同時進行的抓取數
+
+    # 重試設定（逾時、429、5xx 等暫時性錯誤，重試後才改用 Playwright）
+    MAX_RETRIES = 3
+    MAX_RETRY_DELAY = 8  # 秒
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        """
+        Args:
+            session: 外部共用的 aiohttp session（可選，未提供時自行建立）
+        """
         self.headers = {
             'User-Agent': self.USER_AGENT,
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7',
         }
+        self.timeout = aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
+        # 共用的 HTTP session（外部提供或首次使用時建立，重複利用連線）
+        self._session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
+        # 每個網域一個 semaphore（附使用中的請求數，閒置即移除），外加全域上限
+        self._host_sems: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+        self._global_sem = asyncio.BoundedSemaphore(self.MAX_CONCURRENT_FETCHES)
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """
+        佔用該 URL 網域的抓取名額
+
+        沒有請求使用或等待中的網域會移除其 semaphore，長時間執行時不會隨網域數無限累積
+        """
+        try:
+            host = urlparse(url).netloc.lower()
+        except ValueError:
+            # 無法解析的網址（如 http://[bad）共用同一個名額，讓後續抽取照常失敗並改用 RSS 摘要
+            host = ''
+        sem, users = self._host_sems.get(host) or (asyncio.Semaphore(self.MAX_CONCURRENT_PER_HOST), 0)
+        self._host_sems[host] = (sem, users + 1)
+        try:
+            async with sem:
+                yield
+        finally:
+            sem, users = self._host_sems[host]
+            if users <= 1:
+                del self._host_sems[host]
+            else:
+                self._host_sems[host] = (sem, users - 1)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        取得共用的 aiohttp session，避免每次請求都重新建立連線
+        """
+        if self._session is None or self._session.closed:
+            self._owns_session = True
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.CONNECTION_LIMIT,
+                    limit_per_host=self.CONNECTION_LIMIT_PER_HOST,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=30
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """
+        關閉自行建立的 HTTP session（外部提供的 session 由提供者負責關閉）
+        """
+        if self._owns_session and self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def extract_content(
         self,
@@ -81,16 +321,28 @@ class ContentExtractor:
                 'method': 使用的抽取方法
             }
         """
+        # Google News 跳轉連結：之前解析過的話直接改用實際文章 URL
+        is_google_news = 'news.google.com' in url
+        if is_google_news:
+            resolved_url = _resolved_urls.get(normalize_url(url))
+            if resolved_url:
+                url = resolved_url
+                is_google_news = False
+
+        content = None
+
         # 方法 1: 使用 requests + trafilatura
-        content = await self._extract_with_trafilatura(url)
+        # 未解析的 Google News 連結沒有文章 HTML，可用 Playwright 時直接跳過
+        if not (is_google_news and PLAYWRIGHT_AVAILABLE):
+            content = await self._extract_with_trafilatura(url)
 
-        if content and len(content) >= self.MIN_CONTENT_LENGTH:
-            logger.info(f"trafilatura 成功抽取 {len(content)} 字: {url[:50]}...")
-            return {
-                'content': content,
-                'has_full_content': True,
-                'method': 'trafilatura'
-            }
+            if content and len(content) >= self.MIN_CONTENT_LENGTH:
+                logger.info(f"trafilatura 成功抽取 {len(content)} 字: {url[:50]}...")
+                return {
+                    'content': content,
+                    'has_full_content': True,
+                    'method': 'trafilatura'
+                }
 
         # 方法 2: 使用 Playwright（如果啟用）
         if PLAYWRIGHT_AVAILABLE:
@@ -132,27 +384,58 @@ class ContentExtractor:
 
     async def _extract_with_trafilatura(self, url: str) -> Optional[str]:
         """
-        使用 trafilatura 抽取正文
+        使用 trafilatura 抽取正文（結果依正規化 URL 快取）
+        """
+        key = normalize_url(url)
+        content = _extract_cache.get(key)
+        if content is not None:
+            logger.info(f"使用快取的抽取結果: {url[:50]}...")
+            return content
+
+        content = await self._extract_with_trafilatura_uncached(url)
+        if content:
+            _extract_cache.set(key, content)
+        return content
+
+    async def _extract_with_trafilatura_uncached(self, url: str) -> Optional[str]:
+        """
+        實際以 trafilatura 抽取正文
         """
         if not TRAFILATURA_AVAILABLE:
             return await self._extract_basic(url)
 
         try:
-            # 先取得 HTML
-            html = await self._fetch_html(url)
-            if not html:
+            # 先取得 HTML（原始位元組）
+            fetched = await self._fetch_html(url)
+            if not fetched:
                 return None
+            body, _ = fetched
 
-            # 使用 trafilatura 抽取
+            # 直接交給 trafilatura 處理位元組，由它偵測編碼
+            # 第一階段：關閉 jusText/readability 備援演算法（快速）
             content = trafilatura.extract(
-                html,
+                body,
+                url=url,
                 include_comments=False,
                 include_tables=False,
-                no_fallback=False,
-                favor_precision=True
+                no_fallback=True,
+                favor_precision=True,
+                output_format='txt'
             )
 
-            return self._clean_content(content) if content else None
+            # 第二階段：內容太短才啟用備援演算法並優先召回
+            if not content or len(content) < self.MIN_CONTENT_LENGTH:
+                content = trafilatura.extract(
+                    body,
+                    url=url,
+                    include_comments=False,
+                    include_tables=False,
+                    no_fallback=False,
+                    favor_recall=True,
+                    output_format='txt'
+                ) or content
+
+            return self._clean_plaintext(content) if content else None
 
         except Exception as e:
             logger.error(f"trafilatura 抽取失敗: {url[:50]}..., {e}")
@@ -161,33 +444,27 @@ class ContentExtractor:
     async def _extract_basic(self, url: str) -> Optional[str]:
         """
         基礎 HTML 解析（當 trafilatura 不可用時）
-        使用簡單的標籤移除
+        使用 selectolax（或 html.parser）單次走訪移除標籤
         """
         try:
-            html = await self._fetch_html(url)
-            if not html:
+            fetched = await self._fetch_html(url)
+            if not fetched:
                 return None
+            html = self._decode_html(*fetched)
 
-            import re
-
-            # 移除 script 和 style
-            html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
-            html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
-
-            # 移除所有 HTML 標籤
-            text = re.sub(r'<[^>]+>', ' ', html)
-
-            # 清理空白
-            text = re.sub(r'\s+', ' ', text).strip()
+            # 移除 script/style 等標籤並抽取文字，再清理空白與雜訊
+            text = self._clean_html_text(_html_to_text(html))
+            if not text:
+                return None
 
             # 嘗試找出主要內容（簡單啟發式）
             # 取中間較長的段落
             if len(text) > 2000:
                 # 取中間 2000 字
                 start = len(text) // 4
-                text = text[start:start + 2000]
+                text = text[start:start + 2000].strip()
 
-            return self._clean_content(text)
+            return text
 
         except Exception as e:
             logger.error(f"基礎解析失敗: {url[:50]}..., {e}")
@@ -201,29 +478,19 @@ class ContentExtractor:
         if not PLAYWRIGHT_AVAILABLE:
             return None
 
-        browser = None
-        try:
-            from playwright.async_api import async_playwright
-
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-gpu'
-                    ]
-                )
-
-                context = await browser.new_context(
-                    user_agent=self.USER_AGENT,
-                    locale='zh-TW',
-                    timezone_id='Asia/Taipei'
-                )
-
-                page = await context.new_page()
+        async with self._host_slot(url), self._global_sem:
+            return await self._render_with_playwright(url)
 
+    async def _render_with_playwright(self, url: str) -> Optional[str]:
+        """
+        實際執行 Playwright 渲染（由 _extract_with_playwright 控制並發）
+        """
+        try:
+            async with playwright_pool.page(
+                user_agent=self.USER_AGENT,
+                locale='zh-TW',
+                timezone_id='Asia/Taipei'
+            ) as page:
                 # 檢查是否為 Google News 跳轉連結
                 is_google_news = 'news.google.com' in url
 
@@ -234,13 +501,16 @@ class ContentExtractor:
                     # 使用 domcontentloaded 而非 networkidle，因為 Google News 會跳轉
                     await page.goto(url, wait_until='domcontentloaded', timeout=15000)
 
-                    # 等待跳轉完成（最多等 10 秒）
-                    for _ in range(20):
-                        await asyncio.sleep(0.5)
-                        current_url = page.url
-                        if 'news.google.com' not in current_url:
-                            logger.info(f"跳轉成功: {current_url[:60]}...")
-                            break
+                    # 等待跳轉完成（最多等 10 秒，跳轉一發生就立即返回）
+                    try:
+                        await page.wait_for_url(
+                            lambda u: 'news.google.com' not in u,
+                            wait_until='commit',
+                            timeout=10000
+                        )
+                        logger.info(f"跳轉成功: {page.url[:60]}...")
+                    except PlaywrightTimeoutError:
+                        logger.warning(f"等待 Google News 跳轉逾時: {url[:60]}...")
 
                     # 跳轉後等待頁面載入
                     try:
@@ -266,89 +536,119 @@ class ContentExtractor:
                 # 取得最終 URL 和 HTML
                 final_url = page.url
                 html = await page.content()
-                await browser.close()
-
-                logger.info(f"最終頁面 URL: {final_url[:60]}...")
-
-                # 使用 trafilatura 抽取
-                if TRAFILATURA_AVAILABLE and html:
-                    content = trafilatura.extract(
-                        html,
-                        include_comments=False,
-                        include_tables=False,
-                        no_fallback=False,
-                        favor_recall=True  # 優先召回更多內容
-                    )
-                    if content:
-                        logger.info(f"Playwright + trafilatura 成功抽取內容")
-                        return self._clean_content(content)
 
-                return None
+            # 離開 async with 時 context 已關閉，先釋放瀏覽器記憶體再解析
+            logger.info(f"最終頁面 URL: {final_url[:60]}...")
+
+            # 記錄 Google News 跳轉結果，下次可直接抓取實際文章
+            if 'news.google.com' in url and 'news.google.com' not in final_url:
+                _resolved_urls.set(normalize_url(url), final_url)
+
+            # 使用 trafilatura 抽取（page.content() 已是字串，直接傳入避免重新編碼/解碼）
+            if TRAFILATURA_AVAILABLE and html:
+                content = trafilatura.extract(
+                    html,
+                    url=final_url,
+                    include_comments=False,
+                    include_tables=False,
+                    no_fallback=False,
+                    favor_recall=True  # 優先召回更多內容
+                )
+                if content:
+                    logger.info(f"Playwright + trafilatura 成功抽取內容")
+                    return self._clean_plaintext(content)
+
+            return None
 
         except Exception as e:
             logger.error(f"Playwright 抽取失敗: {url[:50]}..., {e}")
-            if browser:
-                try:
-                    await browser.close()
-                except:
-                    pass
             return None
 
-    async def _fetch_html(self, url: str) -> Optional[str]:
+    async def _fetch_html(self, url: str) -> Optional[Tuple[bytes, Optional[str]]]:
         """
         使用 aiohttp 取得 HTML 內容
+
+        Returns:
+            (原始位元組, 回應宣告的編碼)，失敗則返回 None
         """
-        try:
-            timeout = aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url, headers=self.headers, allow_redirects=True) as response:
-                    if response.status != 200:
+        async with self._host_slot(url), self._global_sem:
+            return await self._fetch_html_unlocked(url)
+
+    async def _fetch_html_unlocked(self, url: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        """
+        實際發送 HTTP 請求（由 _fetch_html 控制並發）
+        """
+        for attempt in range(self.MAX_RETRIES):
+            retry_after = None
+            try:
+                session = await self._get_session()
+                async with session.get(
+                    url, headers=self.headers, timeout=self.timeout, allow_redirects=True
+                ) as response:
+                    if response.status in self.RETRY_STATUSES:
+                        logger.warning(f"HTTP {response.status}（第 {attempt + 1} 次）: {url[:50]}...")
+                        retry_after = response.headers.get('Retry-After')
+                    elif response.status != 200:
                         logger.warning(f"HTTP {response.status}: {url[:50]}...")
                         return None
+                    else:
+                        # 檢查內容類型
+                        content_type = response.headers.get('Content-Type', '')
+                        if 'text/html' not in content_type and 'application/xhtml' not in content_type:
+                            logger.warning(f"非 HTML 內容: {content_type}")
+                            return None
+
+                        return await response.read(), response.charset
+
+            except asyncio.TimeoutError:
+                logger.warning(f"請求超時（第 {attempt + 1} 次）: {url[:50]}...")
+            except aiohttp.ClientConnectionError as e:
+                logger.warning(f"連線失敗（第 {attempt + 1} 次）: {url[:50]}..., {e}")
+            except Exception as e:
+                logger.error(f"HTTP 請求失敗: {url[:50]}..., {e}")
+                return None
 
-                    # 檢查內容類型
-                    content_type = response.headers.get('Content-Type', '')
-                    if 'text/html' not in content_type and 'application/xhtml' not in content_type:
-                        logger.warning(f"非 HTML 內容: {content_type}")
-                        return None
+            if attempt + 1 < self.MAX_RETRIES:
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
 
-                    return await response.text()
+        return None
 
-        except asyncio.TimeoutError:
-            logger.warning(f"請求超時: {url[:50]}...")
-            return None
-        except Exception as e:
-            logger.error(f"HTTP 請求失敗: {url[:50]}..., {e}")
-            return None
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        重試等待秒數：指數退避加隨機抖動，429 有 Retry-After 時優先採用
+        """
+        if retry_after and retry_after.isdigit():
+            return min(self.MAX_RETRY_DELAY, int(retry_after))
+        return min(self.MAX_RETRY_DELAY, 0.5 * 2 ** attempt) + random.random() * 0.2
+
+    def _decode_html(self, body: bytes, charset: Optional[str]) -> str:
+        """
+        將 HTML 位元組解碼為字串（只有基礎解析需要）
+        """
+        try:
+            return body.decode(charset or 'utf-8', errors='replace')
+        except LookupError:
+            # 回應宣告了未知的編碼名稱
+            return body.decode('utf-8', errors='replace')
 
-    def _clean_content(self, content: Optional[str]) -> Optional[str]:
+    def _clean_plaintext(self, content: Optional[str]) -> Optional[str]:
         """
-        清理正文內容
+        清理已是純文字的正文（trafilatura 輸出）
+        trafilatura 已正規化空白，只需移除常見的頁面元素文字
         """
         if not content:
             return None
 
-        import re
-
-        # 移除多餘空白
-        content = re.sub(r'\s+', ' ', content)
-
-        # 移除開頭結尾空白
-        content = content.strip()
+        return _NOISE_RE.sub('', content).strip()
 
-        # 移除常見的頁面元素文字
-        noise_patterns = [
-            r'訂閱電子報',
-            r'加入會員',
-            r'免費註冊',
-            r'分享到',
-            r'Advertisement',
-            r'Sponsored',
-            r'Loading\.\.\.',
-            r'Please wait',
-        ]
+    def _clean_html_text(self, content: Optional[str]) -> Optional[str]:
+        """
+        清理從 HTML 直接抽出的文字（基礎解析）
+        """
+        if not content:
+            return None
 
-        for pattern in noise_patterns:
-            content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+        # 一次掃描完成：移除多餘空白並移除常見的頁面元素文字
+        content = _WS_NOISE_RE.sub(_ws_noise_repl, content)
 
         return content.strip()
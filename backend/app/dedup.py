@@ -0,0 +1,160 @@
+"""
+去重工具模組
+提供 URL 正規化與相近標題偵測，供 RSS 與 Google Search 抓取器共用
+"""
+
+import functools
+import hashlib
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+# 要移除的 tracking 參數（另外所有 utm_* 都會移除）
+TRACKING_PARAMS = frozenset({
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'fbclid', 'gclid', 'msclkid', 'ref', 'source', 'mc_cid', 'mc_eid'
+})
+
+# 一次掃描移除 tracking 參數（含所有 utm_*）與空參數，不分大小寫
+_TRACKING_RE = re.compile(
+    r'(?:^|&)(?:(?:utm_[^&=]*|' + '|'.join(map(re.escape, sorted(TRACKING_PARAMS))) + r')(?:=[^&]*)?)?(?=&|$)',
+    re.I
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_url(url: str) -> str:
+    """
+    URL 正規化（作為去重的 key，結果快取）
+
+    網域轉小寫並去掉 www.、移除結尾斜線、fragment 與 tracking 參數，忽略 http/https 差異；
+    路徑大小寫與其餘參數有意義，保持原樣（不重新編碼）
+    """
+    if '?' not in url and '#' not in url:
+        # 大多數文章網址沒有參數，直接切字串，不必完整解析
+        rest = url.split('://', 1)[-1]
+        host, sep, path = rest.partition('/')
+        return f"{_strip_www(host.lower())}{(sep + path).rstrip('/')}"
+
+    parsed = urlsplit(url)
+    key = f"{_strip_www(parsed.netloc.lower())}{parsed.path.rstrip('/')}"
+    if not parsed.query:
+        return key
+
+    # 以單一正規表示式移除 tracking 參數與空參數，其餘原樣保留
+    query = _TRACKING_RE.sub('', parsed.query).lstrip('&')
+    return f"{key}?{query}" if query else key
+
+
+def _strip_www(host: str) -> str:
+    """去掉網域開頭的 www.（www.example.com 與 example.com 視為同一網站）"""
+    return host[4:] if host.startswith('www.') else host
+
+
+def normalize_url(url: str) -> str:
+    """
+    取得去重用的 URL key
+
+    無法解析的網址（如 http://[bad）退回原字串小寫，不讓單一壞連結中斷整批去重
+    """
+    try:
+        return canonical_url(url)
+    except ValueError as e:
+        logger.debug(f"URL 正規化失敗: {url}, {e}")
+        return url.lower()
+
+
+# 相近標題偵測（SimHash）設定
+SIMHASH_BITS = 64
+SIMHASH_MASK = (1 << SIMHASH_BITS) - 1
+SIMHASH_MAX_DISTANCE = 3  # 漢明距離不超過此值視為相近標題
+SIMHASH_SHINGLE = 3  # 以連續 3 個字元為特徵
+SIMHASH_MAX_AGE = 86400  # 發布時間相差一天以上不視為重複（秒）
+
+
+@functools.lru_cache(maxsize=16384)
+def _shingle_hash(gram: str) -> int:
+    """
+    特徵的 64-bit hash（blake2b，跨行程固定，重啟後去重結果一致；常見字串結果快取）
+    """
+    return int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'big')
+
+
+def title_simhash(title: str) -> int:
+    """
+    計算標題的 64-bit SimHash（字元 3-gram 特徵，忽略大小寫、空白與標點）
+    """
+    text = _NON_WORD_RE.sub('', title.lower())
+    if not text:
+        return 0
+
+    # 以位元切片計數：planes[k] 的第 b 位元是「第 b 位元為 1 的特徵數」的第 k 位，
+    # 每個特徵只需幾次整數位元運算即可累加到全部 64 個位元
+    size = SIMHASH_SHINGLE
+    planes: List[int] = []
+    count = 0
+    for i in range(max(1, len(text) - size + 1)):
+        carry = _shingle_hash(text[i:i + size])
+        count += 1
+        for k, plane in enumerate(planes):
+            planes[k] = plane ^ carry
+            carry &= plane
+            if not carry:
+                break
+        else:
+            if carry:
+                planes.append(carry)
+
+    # 計數超過半數的位元設為 1：由高位往低位逐段比較各位元的計數與門檻
+    threshold = count // 2 + 1
+    greater, equal = 0, SIMHASH_MASK
+    for k in range(max(len(planes), threshold.bit_length()) - 1, -1, -1):
+        plane = planes[k] if k < len(planes) else 0
+        if threshold >> k & 1:
+            equal &= plane
+        else:
+            greater |= equal & plane
+            equal &= ~plane
+    return greater | equal
+
+
+class NearDuplicateTitles:
+    """
+    相近標題偵測器（SimHash + 分段索引）
+
+    將 64 bits 分成 SIMHASH_MAX_DISTANCE + 1 段，距離在門檻內的兩個 hash 至少有一段完全相同，
+    因此只需比對同段的候選，不必兩兩比較所有標題
+    """
+
+    BLOCKS = SIMHASH_MAX_DISTANCE + 1
+    BLOCK_BITS = SIMHASH_BITS // BLOCKS
+    BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, int], List[Tuple[int, Optional[float]]]] = defaultdict(list)
+
+    def is_duplicate(self, title: str, published_ts: Optional[float] = None) -> bool:
+        """
+        標題與先前加入的標題相近（且發布時間相差不到一天）則返回 True，否則加入索引
+        """
+        value = title_simhash(title)
+        if not value:
+            return False
+
+        keys = [(i, value >> (i * self.BLOCK_BITS) & self.BLOCK_MASK) for i in range(self.BLOCKS)]
+        for key in keys:
+            for other, other_ts in self._buckets.get(key, ()):
+                if (value ^ other).bit_count() > SIMHASH_MAX_DISTANCE:
+                    continue
+                if published_ts is None or other_ts is None or abs(published_ts - other_ts) < SIMHASH_MAX_AGE:
+                    return True
+
+        for key in keys:
+            self._buckets[key].append((value, published_ts))
+        return False
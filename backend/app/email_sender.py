@@ -9,11 +9,100 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-from typing import Dict, List
-import pytz
+from typing import Dict, List, Tuple
+from zoneinfo import ZoneInfo
+from jinja2 import Environment, BaseLoader
 
 logger = logging.getLogger(__name__)
 
+# 郵件中的時間一律以台北時區顯示
+TAIPEI_TZ = ZoneInfo('Asia/Taipei')
+
+# HTML 郵件模板（模組載入時編譯一次，autoescape 負責跳脫標題/來源/摘要等欄位）
+EMAIL_HTML_TEMPLATE = '''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        </head>
+        <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Noto Sans TC', sans-serif; background-color: #f0f2f5; margin: 0; padding: 20px;">
+            <div style="max-width: 700px; margin: 0 auto; background-color: white; border-radius: 12px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+
+                <!-- Header -->
+                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center;">
+                    <h1 style="color: white; margin: 0; font-size: 24px;">📰 每日新聞摘要</h1>
+                    <p style="color: rgba(255,255,255,0.9); margin: 10px 0 0 0; font-size: 14px;">自動抓取 · 智能摘要 · 定時推送</p>
+                </div>
+
+                <!-- Search Info -->
+                <div style="padding: 20px 30px; background-color: #f8f9fa; border-bottom: 1px solid #eee;">
+                    <table style="width: 100%; font-size: 14px; color: #555;">
+                        <tr>
+                            <td style="padding: 5px 0;"><strong>搜尋關鍵字:</strong></td>
+                            <td style="padding: 5px 0;">{{ keyword }}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 5px 0;"><strong>語言:</strong></td>
+                            <td style="padding: 5px 0;">{{ language }}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 5px 0;"><strong>日期範圍:</strong></td>
+                            <td style="padding: 5px 0;">{{ date_range }}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 5px 0;"><strong>產生時間:</strong></td>
+                            <td style="padding: 5px 0;">{{ generated_time }} (Asia/Taipei)</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 5px 0;"><strong>文章數量:</strong></td>
+                            <td style="padding: 5px 0;">{{ articles|length }} 篇</td>
+                        </tr>
+                    </table>
+                </div>
+
+                <!-- Articles -->
+                <div style="padding: 30px;">
+                    <h2 style="color: #333; font-size: 18px; margin: 0 0 20px 0; padding-bottom: 10px; border-bottom: 2px solid #667eea;">
+                        📋 文章列表
+                    </h2>
+                    {% for article in articles %}
+                    <div style="margin-bottom: 25px; padding: 20px; background-color: #f8f9fa; border-radius: 8px; border-left: 4px solid #667eea;">
+                        <h3 style="margin: 0 0 10px 0; font-size: 16px;">
+                            <a href="{{ article.url }}" style="color: #2c3e50; text-decoration: none;" target="_blank">
+                                {{ loop.index }}. {{ article.title }}
+                            </a>
+                        </h3>
+                        <div style="color: #888; font-size: 13px; margin-bottom: 12px;">
+                            📰 {{ article.source }} &nbsp;|&nbsp; 🕐 {{ article.published or '未知時間' }}
+                        </div>
+                        {% if article.has_full_content %}
+                        <div>
+                        {% else %}
+                        <div style="background-color: #fff3cd; padding: 10px; border-radius: 4px;">
+                            <span style="color: #856404; font-size: 12px;">(無法取得全文，使用索引摘要)</span><br>
+                        {% endif %}
+                            <p style="color: #444; font-size: 14px; line-height: 1.7; margin: 0;">
+                                {{ article.summary }}
+                            </p>
+                        </div>
+                    </div>
+                    {% endfor %}
+                </div>
+
+                <!-- Footer -->
+                <div style="padding: 20px 30px; background-color: #f8f9fa; text-align: center; color: #888; font-size: 12px;">
+                    <p style="margin: 0;">此郵件由「每日新聞自動摘要系統」自動產生</p>
+                    <p style="margin: 5px 0 0 0;">Powered by FastAPI + Google News RSS</p>
+                </div>
+
+            </div>
+        </body>
+        </html>
+        '''
+
+EMAIL_TEMPLATE = Environment(loader=BaseLoader(), autoescape=True).from_string(EMAIL_HTML_TEMPLATE)
+
 
 class EmailSender:
     """
@@ -70,57 +159,141 @@ class EmailSender:
             }
 
         try:
-            # 產生郵件內容
-            subject = self._generate_subject(search_params)
-            html_body = self._generate_html_body(articles, search_params)
-
-            # 建立郵件
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.smtp_user
-            msg['To'] = to_email
-
-            # 加入 HTML 內容
-            html_part = MIMEText(html_body, 'html', 'utf-8')
-            msg.attach(html_part)
+            msg = self._build_message(to_email, articles, search_params)
 
             # 發送郵件
             logger.info(f"正在發送郵件到 {to_email}...")
 
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_pass)
+            server = self._open_smtp()
+            try:
                 server.send_message(msg)
+            finally:
+                self._close_smtp(server)
 
             logger.info(f"郵件發送成功: {to_email}")
             return {'success': True, 'error': None}
 
-        except smtplib.SMTPAuthenticationError as e:
+        except Exception as e:
+            return self._error_result(e, to_email)
+
+    def send_batch(self, items: List[Tuple[str, List[Dict], Dict]]) -> List[Dict]:
+        """
+        以同一條 SMTP 連線寄送多封新聞摘要郵件
+
+        只進行一次連線、STARTTLS 與登入，之後每封郵件只需傳送資料
+
+        Args:
+            items: (收件人 Email, 文章列表, 搜尋參數) 的列表
+
+        Returns:
+            與 items 順序對應的結果列表，格式同 send_news_email
+        """
+        if not self.is_configured:
+            return [{
+                'success': False,
+                'error': 'SMTP 未設定，請檢查環境變數 SMTP_USER 和 SMTP_PASS'
+            } for _ in items]
+
+        if not items:
+            return []
+
+        try:
+            server = self._open_smtp()
+        except Exception as e:
+            # 連線或登入失敗，整批都無法寄送
+            error = self._error_result(e, '')
+            return [dict(error) for _ in items]
+
+        results = []
+        try:
+            for to_email, articles, search_params in items:
+                if not articles:
+                    results.append({'success': False, 'error': '沒有文章可寄送'})
+                    continue
+
+                try:
+                    msg = self._build_message(to_email, articles, search_params)
+                    server.send_message(msg)
+                    logger.info(f"郵件發送成功: {to_email}")
+                    results.append({'success': True, 'error': None})
+                except Exception as e:
+                    results.append(self._error_result(e, to_email))
+        finally:
+            self._close_smtp(server)
+
+        return results
+
+    def _build_message(
+        self,
+        to_email: str,
+        articles: List[Dict],
+        search_params: Dict
+    ) -> MIMEMultipart:
+        """
+        建立郵件物件
+        """
+        # 產生郵件內容
+        subject = self._generate_subject(search_params)
+        html_body = self._generate_html_body(articles, search_params)
+
+        # 建立郵件
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.smtp_user
+        msg['To'] = to_email
+
+        # 加入 HTML 內容
+        html_part = MIMEText(html_body, 'html', 'utf-8')
+        msg.attach(html_part)
+
+        return msg
+
+    def _open_smtp(self) -> smtplib.SMTP:
+        """
+        建立 SMTP 連線並完成 STARTTLS 與登入
+        """
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+        try:
+            server.starttls()
+            server.login(self.smtp_user, self.smtp_pass)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _close_smtp(self, server: smtplib.SMTP):
+        """
+        關閉 SMTP 連線
+        """
+        try:
+            server.quit()
+        except smtplib.SMTPException:
+            server.close()
+
+    def _error_result(self, e: Exception, to_email: str) -> Dict:
+        """
+        將寄送時的例外轉換為回傳結果
+        """
+        if isinstance(e, smtplib.SMTPAuthenticationError):
             error_msg = 'SMTP 認證失敗，請檢查帳號密碼（Gmail 需使用 App Password）'
             logger.error(f"{error_msg}: {e}")
-            return {'success': False, 'error': error_msg}
-
-        except smtplib.SMTPRecipientsRefused as e:
+        elif isinstance(e, smtplib.SMTPRecipientsRefused):
             error_msg = f'收件人地址被拒絕: {to_email}'
             logger.error(f"{error_msg}: {e}")
-            return {'success': False, 'error': error_msg}
-
-        except smtplib.SMTPException as e:
+        elif isinstance(e, smtplib.SMTPException):
             error_msg = f'SMTP 錯誤: {str(e)}'
             logger.error(error_msg)
-            return {'success': False, 'error': error_msg}
-
-        except Exception as e:
+        else:
             error_msg = f'發送郵件時發生未知錯誤: {str(e)}'
-            logger.error(error_msg, exc_info=True)
-            return {'success': False, 'error': error_msg}
+            logger.error(error_msg, exc_info=e)
+
+        return {'success': False, 'error': error_msg}
 
     def _generate_subject(self, search_params: Dict) -> str:
         """
         產生郵件主旨
         """
-        taipei_tz = pytz.timezone('Asia/Taipei')
-        now = datetime.now(taipei_tz)
+        now = datetime.now(TAIPEI_TZ)
         date_str = now.strftime('%Y/%m/%d')
 
         keyword = search_params.get('keyword', '新聞')
@@ -132,10 +305,9 @@ class EmailSender:
         search_params: Dict
     ) -> str:
         """
-        產生 HTML 郵件內容
+        產生 HTML 郵件內容（以預先編譯的模板渲染，並自動跳脫 HTML）
         """
-        taipei_tz = pytz.timezone('Asia/Taipei')
-        now = datetime.now(taipei_tz)
+        now = datetime.now(TAIPEI_TZ)
         generated_time = now.strftime('%Y-%m-%d %H:%M:%S')
 
         # 語言文字對應
@@ -156,125 +328,31 @@ class EmailSender:
             end = search_params.get('end_date', '')
             date_range = f"{start} ~ {end}"
 
-        # 產生文章列表 HTML
-        articles_html = ''
-        for i, article in enumerate(articles, 1):
-            title = self._escape_html(article.get('title', '無標題'))
-            url = article.get('url', '#')
-            source = self._escape_html(article.get('source', '未知來源'))
-            summary = self._escape_html(article.get('summary', '無摘要'))
-            has_full = article.get('has_full_content', True)
-
+        # 整理文章欄位
+        article_items = []
+        for article in articles:
             # 處理時間
             published = article.get('published', '')
             if published:
                 try:
                     dt = datetime.fromisoformat(published.replace('Z', '+00:00'))
-                    published = dt.astimezone(taipei_tz).strftime('%Y-%m-%d %H:%M')
+                    published = dt.astimezone(TAIPEI_TZ).strftime('%Y-%m-%d %H:%M')
                 except:
                     pass
 
-            # 摘要樣式
-            summary_style = ''
-            summary_note = ''
-            if not has_full:
-                summary_style = 'background-color: #fff3cd; padding: 10px; border-radius: 4px;'
-                summary_note = '<span style="color: #856404; font-size: 12px;">(無法取得全文，使用索引摘要)</span><br>'
-
-            articles_html += f'''
-            <div style="margin-bottom: 25px; padding: 20px; background-color: #f8f9fa; border-radius: 8px; border-left: 4px solid #667eea;">
-                <h3 style="margin: 0 0 10px 0; font-size: 16px;">
-                    <a href="{url}" style="color: #2c3e50; text-decoration: none;" target="_blank">
-                        {i}. {title}
-                    </a>
-                </h3>
-                <div style="color: #888; font-size: 13px; margin-bottom: 12px;">
-                    📰 {source} &nbsp;|&nbsp; 🕐 {published or '未知時間'}
-                </div>
-                <div style="{summary_style}">
-                    {summary_note}
-                    <p style="color: #444; font-size: 14px; line-height: 1.7; margin: 0;">
-                        {summary}
-                    </p>
-                </div>
-            </div>
-            '''
-
-        # 完整 HTML
-        html = f'''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Noto Sans TC', sans-serif; background-color: #f0f2f5; margin: 0; padding: 20px;">
-            <div style="max-width: 700px; margin: 0 auto; background-color: white; border-radius: 12px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-
-                <!-- Header -->
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center;">
-                    <h1 style="color: white; margin: 0; font-size: 24px;">📰 每日新聞摘要</h1>
-                    <p style="color: rgba(255,255,255,0.9); margin: 10px 0 0 0; font-size: 14px;">自動抓取 · 智能摘要 · 定時推送</p>
-                </div>
-
-                <!-- Search Info -->
-                <div style="padding: 20px 30px; background-color: #f8f9fa; border-bottom: 1px solid #eee;">
-                    <table style="width: 100%; font-size: 14px; color: #555;">
-                        <tr>
-                            <td style="padding: 5px 0;"><strong>搜尋關鍵字:</strong></td>
-                            <td style="padding: 5px 0;">{self._escape_html(keyword)}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 5px 0;"><strong>語言:</strong></td>
-                            <td style="padding: 5px 0;">{language}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 5px 0;"><strong>日期範圍:</strong></td>
-                            <td style="padding: 5px 0;">{date_range}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 5px 0;"><strong>產生時間:</strong></td>
-                            <td style="padding: 5px 0;">{generated_time} (Asia/Taipei)</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 5px 0;"><strong>文章數量:</strong></td>
-                            <td style="padding: 5px 0;">{len(articles)} 篇</td>
-                        </tr>
-                    </table>
-                </div>
-
-                <!-- Articles -->
-                <div style="padding: 30px;">
-                    <h2 style="color: #333; font-size: 18px; margin: 0 0 20px 0; padding-bottom: 10px; border-bottom: 2px solid #667eea;">
-                        📋 文章列表
-                    </h2>
-                    {articles_html}
-                </div>
-
-                <!-- Footer -->
-                <div style="padding: 20px 30px; background-color: #f8f9fa; text-align: center; color: #888; font-size: 12px;">
-                    <p style="margin: 0;">此郵件由「每日新聞自動摘要系統」自動產生</p>
-                    <p style="margin: 5px 0 0 0;">Powered by FastAPI + Google News RSS</p>
-                </div>
-
-            </div>
-        </body>
-        </html>
-        '''
-
-        return html
-
-    def _escape_html(self, text: str) -> str:
-        """
-        跳脫 HTML 特殊字元
-        """
-        if not text:
-            return ''
-        return (
-            text
-            .replace('&', '&amp;')
-            .replace('<', '&lt;')
-            .replace('>', '&gt;')
-            .replace('"', '&quot;')
-            .replace("'", '&#39;')
+            article_items.append({
+                'title': article.get('title', '無標題') or '',
+                'url': article.get('url', '#'),
+                'source': article.get('source', '未知來源') or '',
+                'summary': article.get('summary', '無摘要') or '',
+                'has_full_content': article.get('has_full_content', True),
+                'published': published
+            })
+
+        return EMAIL_TEMPLATE.render(
+            articles=article_items,
+            keyword=keyword,
+            language=language,
+            date_range=date_range,
+            generated_time=generated_time
         )
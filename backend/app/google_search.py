@@ -4,15 +4,25 @@ Google Custom Search API 模組
 """
 
 import logging
+import math
 import os
+import random
+import asyncio
 import aiohttp
-from datetime import datetime
+import orjson
+from datetime import datetime, timezone
+from operator import itemgetter
 from typing import List, Dict, Optional
 from urllib.parse import urlencode
-import pytz
+from zoneinfo import ZoneInfo
+from dateutil import parser as date_parser
+
+from app.dedup import NearDuplicateTitles, normalize_url
 
 logger = logging.getLogger(__name__)
 
+TAIPEI_TZ = ZoneInfo('Asia/Taipei')
+
 
 class GoogleSearchFetcher:
     """
@@ -24,11 +34,40 @@ class GoogleSearchFetcher:
     """
 
     API_URL = "https://www.googleapis.com/customsearch/v1"
+    PAGE_SIZE = 10  # API 單次最多 10 筆
+    MAX_PAGES = 10  # API 最多只能取到第 100 筆
+    MAX_PAGES_PER_REQUEST = 4  # 單次搜尋（所有語言合計）最多呼叫的分頁數，免費配額每天只有 100 次
+
+    # 多抓比例設定（依各語言觀察到的重複率動態調整，避免浪費配額）
+    DUP_RATE_INITIAL = 0.2  # 尚無觀察資料時的預設重複率
+    DUP_RATE_MARGIN = 0.1  # 額外保留的安全邊際
+    DUP_RATE_ALPHA = 0.2  # EWMA 平滑係數（新觀察值的權重）
+
+    # HTTP 連線設定（所有查詢都打向同一主機，保持連線重複利用）
+    REQUEST_TIMEOUT = 30  # 秒
+    CONNECTION_LIMIT = 10
+    KEEPALIVE_TIMEOUT = 60  # 秒
 
-    def __init__(self):
+    # 重試設定（逾時、429、5xx 等暫時性錯誤）
+    MAX_RETRIES = 3
+    MAX_RETRY_DELAY = 8  # 秒
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    # 回應超過此大小時改在執行緒中解析 JSON，避免阻塞 event loop
+    JSON_THREAD_THRESHOLD = 64 * 1024  # bytes
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        """
+        Args:
+            session: 外部共用的 aiohttp session（可選，未提供時自行建立）
+        """
         self.api_key = os.getenv('GOOGLE_API_KEY', '')
         self.search_engine_id = os.getenv('GOOGLE_SEARCH_ENGINE_ID', '')
-        self.taipei_tz = pytz.timezone('Asia/Taipei')
+        # 共用的 HTTP session（外部提供或首次使用時建立，重複利用連線）
+        self._session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
+        # 各語言設定（zh-TW、en-US、both）完整去重後被去掉的比例（EWMA）
+        self._dup_rates: Dict[str, float] = {}
 
         if not self.api_key or not self.search_engine_id:
             logger.warning("Google Search API 未設定，請設定 GOOGLE_API_KEY 和 GOOGLE_SEARCH_ENGINE_ID")
@@ -37,6 +76,31 @@ class GoogleSearchFetcher:
         """檢查 API 是否已設定"""
         return bool(self.api_key and self.search_engine_id)
 
+    @staticmethod
+    def is_env_configured() -> bool:
+        """只檢查環境變數是否已設定 API（不需建立實例）"""
+        return bool(os.getenv('GOOGLE_API_KEY') and os.getenv('GOOGLE_SEARCH_ENGINE_ID'))
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """取得共用的 aiohttp session，避免每次查詢都重新建立連線"""
+        if self._session is None or self._session.closed:
+            self._owns_session = True
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.CONNECTION_LIMIT,
+                    limit_per_host=self.CONNECTION_LIMIT,
+                    keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+                    ttl_dns_cache=300
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """關閉自行建立的 HTTP session（外部提供的 session 由提供者負責關閉）"""
+        if self._owns_session and self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def fetch_news(
         self,
         keyword: str,
@@ -53,7 +117,7 @@ class GoogleSearchFetcher:
             language: 語言 (zh-TW, en-US, both)
             start_date: 開始日期
             end_date: 結束日期
-            max_count: 最大抓取數量 (API 單次最多 10 筆)
+            max_count: 最大抓取數量（超過 10 筆時分頁同時抓取）
 
         Returns:
             新聞列表
@@ -64,20 +128,39 @@ class GoogleSearchFetcher:
 
         articles = []
 
+        # 依觀察到的重複率多抓一些，去重後仍能湊滿 max_count 篇
+        fetch_count = self._overfetch_count(language, max_count)
+
+        # 中英文同時搜尋時各抓一半，合計分頁數不超過 MAX_PAGES_PER_REQUEST
+        language_count = 2 if language == 'both' else 1
+        fetch_count = min(
+            math.ceil(fetch_count / language_count),
+            max(1, self.MAX_PAGES_PER_REQUEST // language_count) * self.PAGE_SIZE
+        )
+
         # 根據語言設定搜尋參數
         if language == 'both':
             # 同時搜尋中英文
-            zh_articles = await self._search(keyword, 'zh-TW', start_date, end_date, max_count)
-            en_articles = await self._search(keyword, 'en-US', start_date, end_date, max_count)
-            articles.extend(zh_articles)
-            articles.extend(en_articles)
+            results = await asyncio.gather(
+                self._search(keyword, 'zh-TW', start_date, end_date, fetch_count),
+                self._search(keyword, 'en-US', start_date, end_date, fetch_count),
+                return_exceptions=True
+            )
+
+            for lang, result in zip(['zh-TW', 'en-US'], results):
+                if isinstance(result, Exception):
+                    logger.error(f"Google Search {lang} 搜尋失敗: {result}")
+                else:
+                    articles.extend(result)
         else:
-            articles = await self._search(keyword, language, start_date, end_date, max_count)
+            articles = await self._search(keyword, language, start_date, end_date, fetch_count)
 
-        # 依時間排序
+        # 依時間排序後完整去重（含跨語言與相近標題），以實際被去掉的比例更新重複率，再限制數量
         articles = self._sort_by_time(articles)
+        unique_articles = self.deduplicate_articles(articles)
+        self._update_dup_rate(language, len(articles), len(unique_articles))
 
-        return articles[:max_count]
+        return unique_articles[:max_count]
 
     async def _search(
         self,
@@ -85,10 +168,13 @@ class GoogleSearchFetcher:
         language: str,
         start_date: datetime,
         end_date: datetime,
-        max_count: int
+        fetch_count: int
     ) -> List[Dict]:
         """
         執行單一語言搜尋
+
+        Args:
+            fetch_count: 該語言要抓取的筆數（已含多抓與分攤）
         """
         # 語言對應
         lang_map = {
@@ -105,7 +191,6 @@ class GoogleSearchFetcher:
             'key': self.api_key,
             'cx': self.search_engine_id,
             'q': f'{keyword} 新聞' if language == 'zh-TW' else f'{keyword} news',
-            'num': min(max_count, 10),  # API 單次最多 10 筆
             'lr': lang_config['lr'],
             'gl': lang_config['gl'],
             'hl': lang_config['hl'],
@@ -117,41 +202,105 @@ class GoogleSearchFetcher:
         if date_restrict:
             params['dateRestrict'] = date_restrict
 
-        url = f"{self.API_URL}?{urlencode(params)}"
         logger.info(f"Google Search API 查詢: {keyword} ({language})")
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                    if response.status == 403:
-                        logger.error("Google Search API 配額已用完或 API Key 無效")
-                        return []
-
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Google Search API 錯誤: {response.status} - {error_text}")
-                        return []
-
-                    data = await response.json()
+        fetch_count = min(fetch_count, self.PAGE_SIZE * self.MAX_PAGES)
 
-            # 解析結果
-            articles = []
-            items = data.get('items', [])
+        # API 單次最多 10 筆，需要更多時同時送出所有分頁請求（共用 keep-alive 連線）
+        page_count = math.ceil(fetch_count / self.PAGE_SIZE)
+        pages = await asyncio.gather(*(
+            self._fetch_page(
+                params,
+                start=1 + page * self.PAGE_SIZE,
+                num=min(self.PAGE_SIZE, fetch_count - page * self.PAGE_SIZE)
+            )
+            for page in range(page_count)
+        ))
 
+        # 解析結果（依分頁順序）
+        articles = []
+        for items in pages:
             for item in items:
                 article = self._parse_item(item, language)
                 if article:
                     articles.append(article)
 
-            logger.info(f"Google Search 找到 {len(articles)} 篇文章 ({language})")
-            return articles
+        logger.info(f"Google Search 找到 {len(articles)} 篇文章 ({language})")
+        return articles
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Google Search API 網路錯誤: {e}")
-            return []
-        except Exception as e:
-            logger.error(f"Google Search API 錯誤: {e}")
+    def _overfetch_count(self, language: str, max_count: int) -> int:
+        """依該語言設定（zh-TW、en-US、both）的重複率計算實際要抓取的筆數"""
+        dup_rate = self._dup_rates.get(language, self.DUP_RATE_INITIAL)
+        return max(max_count, math.ceil(max_count * (1 + dup_rate + self.DUP_RATE_MARGIN)))
+
+    def _update_dup_rate(self, language: str, raw_count: int, unique_count: int):
+        """以本次完整去重後被去掉的比例更新該語言設定的重複率（EWMA）"""
+        if not raw_count:
+            return
+        observed = 1 - unique_count / raw_count
+        previous = self._dup_rates.get(language, self.DUP_RATE_INITIAL)
+        self._dup_rates[language] = (1 - self.DUP_RATE_ALPHA) * previous + self.DUP_RATE_ALPHA * observed
+
+    async def _fetch_page(self, params: Dict, start: int, num: int) -> List[Dict]:
+        """
+        抓取單一分頁的搜尋結果，失敗則返回空列表
+        """
+        url = f"{self.API_URL}?{urlencode({**params, 'start': start, 'num': num})}"
+        data = await self._request_json(url)
+        if data is None:
             return []
+        return data.get('items', [])
+
+    async def _request_json(self, url: str) -> Optional[Dict]:
+        """
+        呼叫 API 並解析 JSON，遇到暫時性錯誤時以指數退避重試
+
+        403 代表配額用完或 API Key 無效，重試沒有意義，直接放棄
+        """
+        for attempt in range(self.MAX_RETRIES):
+            retry_after = None
+            try:
+                session = await self._get_session()
+                async with session.get(
+                    url, timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
+                ) as response:
+                    if response.status == 403:
+                        logger.error("Google Search API 配額已用完或 API Key 無效")
+                        return None
+
+                    if response.status in self.RETRY_STATUSES:
+                        logger.warning(f"Google Search API 暫時性錯誤: {response.status}（第 {attempt + 1} 次）")
+                        retry_after = response.headers.get('Retry-After')
+                    elif response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"Google Search API 錯誤: {response.status} - {error_text}")
+                        return None
+                    else:
+                        body = await response.read()
+                        if len(body) > self.JSON_THREAD_THRESHOLD:
+                            return await asyncio.to_thread(orjson.loads, body)
+                        return orjson.loads(body)
+
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                logger.warning(f"Google Search API 網路錯誤（第 {attempt + 1} 次）: {e!r}")
+            except aiohttp.ClientError as e:
+                logger.error(f"Google Search API 網路錯誤: {e}")
+                return None
+            except Exception as e:
+                logger.error(f"Google Search API 錯誤: {e}")
+                return None
+
+            if attempt + 1 < self.MAX_RETRIES:
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+        logger.error(f"Google Search API 重試 {self.MAX_RETRIES} 次仍失敗")
+        return None
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """重試等待秒數：指數退避加隨機抖動，有 Retry-After 時優先採用"""
+        if retry_after and retry_after.isdigit():
+            return min(self.MAX_RETRY_DELAY, int(retry_after))
+        return min(self.MAX_RETRY_DELAY, 0.5 * 2 ** attempt) + random.random() * 0.2
 
     def _parse_item(self, item: Dict, language: str) -> Optional[Dict]:
         """
@@ -182,10 +331,13 @@ class GoogleSearchFetcher:
 
             if date_str:
                 try:
-                    from dateutil import parser as date_parser
-                    published_dt = date_parser.parse(date_str)
+                    # metatags 幾乎都是 ISO 8601，先用快速的 fromisoformat，失敗才用 dateutil
+                    try:
+                        published_dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+                    except ValueError:
+                        published_dt = date_parser.parse(date_str)
                     if published_dt.tzinfo is None:
-                        published_dt = pytz.UTC.localize(published_dt)
+                        published_dt = published_dt.replace(tzinfo=timezone.utc)
                     published = published_dt.isoformat()
                 except:
                     pass
@@ -209,6 +361,7 @@ class GoogleSearchFetcher:
                 'source': source,
                 'published': published,
                 'published_dt': published_dt,
+                'published_ts': published_dt.timestamp() if published_dt else None,  # 排序用
                 'summary': snippet,
                 'language': language
             }
@@ -222,13 +375,13 @@ class GoogleSearchFetcher:
         計算日期限制參數
         Google Custom Search 使用 d[number] 格式表示過去 N 天
         """
-        now = datetime.now(self.taipei_tz)
+        now = datetime.now(TAIPEI_TZ)
 
         # 計算從今天到 start_date 的天數差
         if start_date.tzinfo:
-            start_taipei = start_date.astimezone(self.taipei_tz)
+            start_taipei = start_date.astimezone(TAIPEI_TZ)
         else:
-            start_taipei = self.taipei_tz.localize(start_date)
+            start_taipei = start_date.replace(tzinfo=TAIPEI_TZ)
 
         days_diff = (now.date() - start_taipei.date()).days + 1
 
@@ -243,23 +396,29 @@ class GoogleSearchFetcher:
 
     def _sort_by_time(self, articles: List[Dict]) -> List[Dict]:
         """依時間排序（新到舊）"""
-        def sort_key(article):
-            pub_dt = article.get('published_dt')
-            if pub_dt is None:
-                return datetime.min.replace(tzinfo=pytz.UTC)
-            return pub_dt
-
-        return sorted(articles, key=sort_key, reverse=True)
-
-    def deduplicate_articles(self, articles: List[Dict]) -> List[Dict]:
-        """URL 去重"""
+        # 有時間的以 itemgetter 排序，沒有時間的維持原順序排在最後
+        dated = [article for article in articles if article.get('published_ts') is not None]
+        undated = [article for article in articles if article.get('published_ts') is None]
+        dated.sort(key=itemgetter('published_ts'), reverse=True)
+        return dated + undated
+
+    def deduplicate_articles(self, articles: List[Dict], limit: Optional[int] = None) -> List[Dict]:
+        """URL 與相近標題去重（單次走訪，以正規化後的 URL 作為 key，湊滿 limit 篇即停止）"""
         seen_urls = set()
+        titles = NearDuplicateTitles()
         unique = []
 
         for article in articles:
-            url = article['url'].lower().rstrip('/')
-            if url not in seen_urls:
-                seen_urls.add(url)
-                unique.append(article)
+            key = normalize_url(article['url'])
+            if key in seen_urls:
+                continue
+            seen_urls.add(key)
+
+            if titles.is_duplicate(article.get('title', ''), article.get('published_ts')):
+                continue
+
+            unique.append(article)
+            if limit is not None and len(unique) >= limit:
+                break
 
         return unique
@@ -2,87 +2,142 @@
 每日新聞自動摘要系統 - FastAPI 主程式
 """
 
+import asyncio
+import atexit
 import logging
-from fastapi import FastAPI, HTTPException
+import logging.handlers
+import queue
+import aiohttp
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, field_validator, EmailStr
-from typing import Optional, List
-from datetime import datetime
-import pytz
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator, model_validator, EmailStr
+from typing import Dict, Literal, Optional, List
+from datetime import date, datetime, time
+from zoneinfo import ZoneInfo
 
 import os
 from app.news_fetcher import NewsFetcher
 from app.google_search import GoogleSearchFetcher
-from app.content_extractor import ContentExtractor
+from app.content_extractor import ContentExtractor, playwright_pool
 from app.summarizer import Summarizer
 from app.email_sender import EmailSender
 
-# 設定 logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 設定 logging：記錄先放進佇列，由獨立執行緒輸出，寫入 I/O 不阻塞 event loop
+_log_queue = queue.SimpleQueue()
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_output)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+_log_enqueue = logging.handlers.QueueHandler(_log_queue)
+_log_enqueue.setFormatter(logging.Formatter('%(message)s'))  # 只展開訊息，完整格式由輸出端套用
+
+logging.basicConfig(level=logging.INFO, handlers=[_log_enqueue])
 logger = logging.getLogger(__name__)
 
+TAIPEI_TZ = ZoneInfo('Asia/Taipei')
+
+# 同時處理（抓取正文 + 摘要）的文章數上限
+MAX_CONCURRENT_ARTICLES = 8
+
 # 建立 FastAPI app
 app = FastAPI(
     title="每日新聞自動摘要系統",
     description="自動抓取、摘要、寄送新聞的 API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # 所有端點都以 orjson 序列化
+)
+
+# CORS 設定 - 只允許 FRONTEND_ORIGIN 指定的前端來源跨域請求（可用逗號分隔多個，DEV 模式下允許所有來源）
+# 未設定時允許本機開發常用的來源；Docker 部署時前端經 Nginx 轉發為同源，不受此限制
+DEFAULT_FRONTEND_ORIGIN = 'http://localhost:3000,http://127.0.0.1:3000,http://localhost:5600'
+CORS_ORIGINS = (
+    ["*"] if os.getenv('DEV') else
+    [origin.strip() for origin in (os.getenv('FRONTEND_ORIGIN') or DEFAULT_FRONTEND_ORIGIN).split(',')
+     if origin.strip()]
 )
 
-# CORS 設定 - 允許前端跨域請求
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 生產環境應限制來源
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # 預檢請求快取一天，避免每次 POST 前都多一次 OPTIONS
 )
 
 
+# 全應用共用的 HTTP session（啟動時建立，所有請求共用連線池與 keep-alive）
+http_session: Optional[aiohttp.ClientSession] = None
+
+
+@app.on_event("startup")
+async def startup():
+    """應用程式啟動時建立共用資源與各模組（所有請求共用，不再每次重建）"""
+    global http_session
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=100,
+            ttl_dns_cache=300,
+            keepalive_timeout=60
+        )
+    )
+
+    app.state.rss_fetcher = NewsFetcher(session=http_session)
+    app.state.extractor = ContentExtractor(session=http_session)
+    app.state.summarizer = Summarizer()
+    _init_configurable_components()
+
+
+def _init_configurable_components():
+    """
+    建立依賴環境變數設定的模組（啟動時與 /api/settings 更新後呼叫）
+    """
+    app.state.google_fetcher = GoogleSearchFetcher(session=http_session)
+    app.state.email_sender = EmailSender()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """應用程式關閉時釋放共用資源"""
+    await app.state.rss_fetcher.close()
+    await app.state.extractor.close()
+    await app.state.google_fetcher.close()
+    if http_session is not None:
+        await http_session.close()
+    await playwright_pool.shutdown()
+
+
 # ===== 請求/回應模型 =====
 
 class NewsRequest(BaseModel):
-    """新聞搜尋請求"""
-    language: str = Field(..., description="語言: zh-TW, en-US, both")
+    """新聞搜尋請求（固定選項以 Literal 宣告，交由 pydantic-core 驗證）"""
+    language: Literal['zh-TW', 'en-US', 'both'] = Field(..., description="語言: zh-TW, en-US, both")
     keyword: str = Field(..., min_length=1, max_length=200, description="搜尋關鍵字")
     count: int = Field(default=5, ge=1, le=20, description="抓取篇數 (1-20)")
-    date_mode: str = Field(default="today", description="日期模式: today 或 custom")
-    start_date: Optional[str] = Field(default=None, description="開始日期 YYYY-MM-DD")
-    end_date: Optional[str] = Field(default=None, description="結束日期 YYYY-MM-DD")
+    date_mode: Literal['today', 'custom'] = Field(default="today", description="日期模式: today 或 custom")
+    start_date: Optional[date] = Field(default=None, description="開始日期 YYYY-MM-DD")
+    end_date: Optional[date] = Field(default=None, description="結束日期 YYYY-MM-DD")
     email: EmailStr = Field(..., description="收件人 Email")
-    search_mode: str = Field(default="rss", description="搜尋模式: rss 或 google")
-
-    @field_validator('language')
-    @classmethod
-    def validate_language(cls, v):
-        valid = ['zh-TW', 'en-US', 'both']
-        if v not in valid:
-            raise ValueError(f'語言必須是 {valid} 之一')
-        return v
+    search_mode: Literal['rss', 'google'] = Field(default="rss", description="搜尋模式: rss 或 google")
+    include_content: bool = Field(default=False, description="回應是否包含完整正文（預設只回傳摘要）")
 
-    @field_validator('date_mode')
+    @field_validator('keyword', mode='before')
     @classmethod
-    def validate_date_mode(cls, v):
-        if v not in ['today', 'custom']:
-            raise ValueError('日期模式必須是 today 或 custom')
-        return v
+    def strip_keyword(cls, v):
+        # 先去除前後空白，空字串由 min_length 擋下
+        return v.strip() if isinstance(v, str) else v
 
-    @field_validator('keyword')
-    @classmethod
-    def validate_keyword(cls, v):
-        v = v.strip()
-        if not v:
-            raise ValueError('關鍵字不能為空')
-        return v
-
-    @field_validator('search_mode')
-    @classmethod
-    def validate_search_mode(cls, v):
-        if v not in ['rss', 'google']:
-            raise ValueError('搜尋模式必須是 rss 或 google')
-        return v
+    @model_validator(mode='after')
+    def check_date_range(self):
+        if self.date_mode == 'custom':
+            if not self.start_date or not self.end_date:
+                raise ValueError('自訂日期模式必須提供 start_date 和 end_date')
+            if self.start_date > self.end_date:
+                raise ValueError('開始日期不能晚於結束日期')
+        return self
 
 
 class ArticleResponse(BaseModel):
@@ -102,6 +157,7 @@ class EmailStatus(BaseModel):
     """Email 寄送狀態"""
     success: bool
     error: Optional[str] = None
+    pending: bool = False  # 已排入背景寄送，回應時尚未有結果
 
 
 class NewsResponse(BaseModel):
@@ -132,15 +188,53 @@ async def health_check():
     return {"status": "healthy"}
 
 
+# 可在執行階段透過 /api/settings 更新的設定
+SETTINGS_KEYS = ('GOOGLE_API_KEY', 'GOOGLE_SEARCH_ENGINE_ID', 'SMTP_HOST', 'SMTP_PORT', 'SMTP_USER', 'SMTP_PASS')
+# 回傳時需要遮蔽的敏感設定
+MASKED_SETTINGS_KEYS = ('GOOGLE_API_KEY', 'SMTP_PASS')
+
+# 設定快照（環境變數只會在啟動時與 update_settings 時改變，平時直接回傳快取）
+_settings_cache: Dict[str, str] = {}
+_config_cache: Dict[str, bool] = {}
+
+
+def _mask(value: str) -> str:
+    """遮蔽敏感值，只保留前後各 2 字元"""
+    if not value:
+        return ""
+    if len(value) <= 4:
+        return "****"
+    return value[:2] + "*" * (len(value) - 4) + value[-2:]
+
+
+def _rebuild_settings_cache():
+    """
+    重新建立設定快照（啟動時與設定更新後呼叫）
+    """
+    env = os.environ
+    settings = {}
+    for key in SETTINGS_KEYS:
+        value = env.get(key, '')
+        settings[key] = _mask(value) if key in MASKED_SETTINGS_KEYS else value
+
+    _settings_cache.clear()
+    _settings_cache.update(settings)
+
+    _config_cache.clear()
+    _config_cache.update({
+        "google_search_available": GoogleSearchFetcher.is_env_configured(),
+        "smtp_configured": bool(env.get('SMTP_HOST') and env.get('SMTP_USER')),
+        "ai_configured": bool(env.get('AI_API_KEY'))
+    })
+
+
+_rebuild_settings_cache()
+
+
 @app.get("/api/config")
 async def get_config():
     """取得系統設定狀態（供前端判斷可用功能）"""
-    google_search = GoogleSearchFetcher()
-    return {
-        "google_search_available": google_search.is_configured(),
-        "smtp_configured": bool(os.getenv('SMTP_HOST') and os.getenv('SMTP_USER')),
-        "ai_configured": bool(os.getenv('AI_API_KEY'))
-    }
+    return _config_cache
 
 
 @app.post("/api/settings", response_model=dict)
@@ -149,14 +243,16 @@ async def update_settings(settings: dict):
     更新設定（僅限執行階段，重啟後會重置）
     注意：這是簡易實作，生產環境應使用資料庫或設定檔
     """
-    allowed_keys = ['GOOGLE_API_KEY', 'GOOGLE_SEARCH_ENGINE_ID', 'SMTP_HOST', 'SMTP_PORT', 'SMTP_USER', 'SMTP_PASS']
-
     updated = []
     for key, value in settings.items():
-        if key in allowed_keys:
+        if key in SETTINGS_KEYS:
             os.environ[key] = str(value)
             updated.append(key)
-            logger.info(f"設定已更新: {key}")
+            logger.info("設定已更新: %s", key)
+
+    if updated:
+        _rebuild_settings_cache()
+        _init_configurable_components()
 
     return {
         "success": True,
@@ -168,70 +264,61 @@ async def update_settings(settings: dict):
 @app.get("/api/settings")
 async def get_settings():
     """取得目前設定（隱藏敏感值）"""
-    def mask(value: str) -> str:
-        if not value:
-            return ""
-        if len(value) <= 4:
-            return "****"
-        return value[:2] + "*" * (len(value) - 4) + value[-2:]
+    return _settings_cache
 
-    return {
-        "GOOGLE_API_KEY": mask(os.getenv('GOOGLE_API_KEY', '')),
-        "GOOGLE_SEARCH_ENGINE_ID": os.getenv('GOOGLE_SEARCH_ENGINE_ID', ''),
-        "SMTP_HOST": os.getenv('SMTP_HOST', ''),
-        "SMTP_PORT": os.getenv('SMTP_PORT', ''),
-        "SMTP_USER": os.getenv('SMTP_USER', ''),
-        "SMTP_PASS": mask(os.getenv('SMTP_PASS', '')),
-    }
 
-
-@app.post("/api/run", response_model=NewsResponse)
-async def run_news_summary(request: NewsRequest):
+def _send_email_in_background(
+    email_sender: EmailSender,
+    to_email: str,
+    articles: List[dict],
+    search_params: dict
+):
+    """
+    背景寄送 Email 並記錄結果（由 BackgroundTasks 在執行緒中呼叫）
+    """
+    result = email_sender.send_news_email(to_email, articles, search_params)
+    if result['success']:
+        logger.info("背景寄送 Email 成功: %s", to_email)
+    else:
+        logger.error("背景寄送 Email 失敗: %s, %s", to_email, result.get('error'))
+
+
+# 成功回應直接以 ORJSONResponse 回傳、不經 response_model 再驗證一次；schema 仍透過 responses 提供給 API 文件
+@app.post("/api/run", responses={200: {"model": NewsResponse}})
+async def run_news_summary(
+    request: NewsRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request
+):
     """
     執行新聞搜尋、摘要、寄信的主要 API
     """
-    logger.info(f"收到請求: keyword={request.keyword}, language={request.language}, "
-                f"count={request.count}, date_mode={request.date_mode}, search_mode={request.search_mode}")
-
-    taipei_tz = pytz.timezone('Asia/Taipei')
-    now = datetime.now(taipei_tz)
-
-    # 解析日期範圍
-    try:
-        if request.date_mode == 'today':
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = now
-        else:
-            if not request.start_date or not request.end_date:
-                raise HTTPException(
-                    status_code=400,
-                    detail="自訂日期模式必須提供 start_date 和 end_date"
-                )
-            start_date = taipei_tz.localize(
-                datetime.strptime(request.start_date, '%Y-%m-%d')
-            )
-            end_date = taipei_tz.localize(
-                datetime.strptime(request.end_date, '%Y-%m-%d').replace(
-                    hour=23, minute=59, second=59
-                )
-            )
-
-            if start_date > end_date:
-                raise HTTPException(
-                    status_code=400,
-                    detail="開始日期不能晚於結束日期"
-                )
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"日期格式錯誤: {str(e)}")
-
-    # 初始化各模組
-    rss_fetcher = NewsFetcher()
-    google_fetcher = GoogleSearchFetcher()
-    extractor = ContentExtractor()
-    summarizer = Summarizer()
-    email_sender = EmailSender()
-
-    articles = []
+    logger.info("收到請求: keyword=%s, language=%s, count=%d, date_mode=%s, search_mode=%s",
+                request.keyword, request.language, request.count, request.date_mode, request.search_mode)
+
+    now = datetime.now(TAIPEI_TZ)
+
+    # 日期範圍（格式與先後順序已由 NewsRequest 驗證）
+    if request.date_mode == 'today':
+        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = now
+    else:
+        start_date = datetime.combine(request.start_date, time.min, TAIPEI_TZ)
+        end_date = datetime.combine(request.end_date, time(23, 59, 59), TAIPEI_TZ)
+
+    # 日期字串只格式化一次，Email 與 API 回應共用
+    start_str = start_date.date().isoformat()
+    end_str = end_date.date().isoformat()
+
+    # 取得啟動時建立的共用模組
+    state = http_request.app.state
+    rss_fetcher = state.rss_fetcher
+    google_fetcher = state.google_fetcher
+    extractor = state.extractor
+    summarizer = state.summarizer
+    email_sender = state.email_sender
+
+    articles: List[dict] = []
     note = None
     search_mode_used = request.search_mode
 
@@ -247,7 +334,7 @@ async def run_news_summary(request: NewsRequest):
                     language=request.language,
                     start_date=start_date,
                     end_date=end_date,
-                    max_count=request.count * 3
+                    max_count=request.count
                 )
             else:
                 logger.info("Step 1: 使用 Google Custom Search API...")
@@ -256,7 +343,7 @@ async def run_news_summary(request: NewsRequest):
                     language=request.language,
                     start_date=start_date,
                     end_date=end_date,
-                    max_count=request.count * 3
+                    max_count=request.count
                 )
         else:
             logger.info("Step 1: 抓取 Google News RSS...")
@@ -265,7 +352,7 @@ async def run_news_summary(request: NewsRequest):
                 language=request.language,
                 start_date=start_date,
                 end_date=end_date,
-                max_count=request.count * 3
+                max_count=request.count
             )
 
         if not raw_articles:
@@ -277,18 +364,10 @@ async def run_news_summary(request: NewsRequest):
                 note="請嘗試調整關鍵字或放寬日期範圍"
             )
 
-        logger.info(f"找到 {len(raw_articles)} 篇原始新聞")
-
-        # Step 2: 去重
-        logger.info("Step 2: URL 去重...")
-        if search_mode_used == 'google':
-            unique_articles = google_fetcher.deduplicate_articles(raw_articles)
-        else:
-            unique_articles = rss_fetcher.deduplicate_articles(raw_articles)
-        logger.info(f"去重後剩餘 {len(unique_articles)} 篇")
+        logger.info("找到 %d 篇原始新聞", len(raw_articles))
 
-        # 取前 N 篇
-        selected_articles = unique_articles[:request.count]
+        # Step 2: 去重已在抓取時完成（正規化 URL，湊滿篇數即停止），這裡只取前 N 篇
+        selected_articles = raw_articles[:request.count]
 
         if len(selected_articles) < request.count:
             note = f"符合條件的新聞僅 {len(selected_articles)} 篇，少於要求的 {request.count} 篇"
@@ -296,71 +375,97 @@ async def run_news_summary(request: NewsRequest):
 
         # Step 3: 抓取正文並產生摘要
         logger.info("Step 3: 抓取正文並產生摘要...")
-        for i, article in enumerate(selected_articles):
-            logger.info(f"處理第 {i+1}/{len(selected_articles)} 篇: {article['title'][:50]}...")
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_ARTICLES)
 
-            # 抓取正文
-            content_result = await extractor.extract_content(
-                url=article['url'],
-                fallback_summary=article.get('summary', '')
-            )
+        async def process_article(i: int, article: dict) -> dict:
+            async with semaphore:
+                logger.info("處理第 %d/%d 篇: %.50s...", i + 1, len(selected_articles), article['title'])
 
-            # 產生摘要
-            summary = summarizer.summarize(
-                text=content_result['content'],
-                use_ai=False  # 先用 placeholder，未來可改為 True
-            )
+                # 抓取正文
+                content_result = await extractor.extract_content(
+                    url=article['url'],
+                    fallback_summary=article.get('summary', '')
+                )
 
-            articles.append(ArticleResponse(
-                title=article['title'],
-                url=article['url'],
-                source=article.get('source'),
-                published=article.get('published'),
-                language=article.get('language'),
-                content=content_result['content'],  # 完整內容
-                summary=summary,
-                has_full_content=content_result['has_full_content'],
-                extract_method=content_result.get('method')
-            ))
-
-        # Step 4: 寄送 Email
-        logger.info("Step 4: 寄送 Email...")
-        email_result = email_sender.send_news_email(
-            to_email=request.email,
-            articles=[a.model_dump() for a in articles],
-            search_params={
-                'keyword': request.keyword,
-                'language': request.language,
-                'date_mode': request.date_mode,
-                'start_date': request.start_date or start_date.strftime('%Y-%m-%d'),
-                'end_date': request.end_date or end_date.strftime('%Y-%m-%d'),
-                'count': request.count
+            # 直接組成 dict，同一份資料供 Email 與 API 回應共用，不再 model_dump 來回轉換
+            return {
+                'title': article['title'],
+                'url': article['url'],
+                'source': article.get('source'),
+                'published': article.get('published'),
+                'language': article.get('language'),
+                'content': content_result['content'],  # 完整內容
+                'summary': None,
+                'has_full_content': content_result['has_full_content'],
+                'extract_method': content_result.get('method')
             }
+
+        # 同時處理多篇文章（結果維持原本順序）
+        results = await asyncio.gather(
+            *(process_article(i, article) for i, article in enumerate(selected_articles)),
+            return_exceptions=True
         )
 
-        email_status = EmailStatus(
-            success=email_result['success'],
-            error=email_result.get('error')
+        for article, result in zip(selected_articles, results):
+            if isinstance(result, Exception):
+                logger.warning("處理文章失敗，略過: %.50s..., %s", article['url'], result)
+            else:
+                articles.append(result)
+
+        # 一次批次產生所有摘要（未來改用 AI 摘要時可合併成單一請求）
+        summaries = await summarizer.summarize_batch(
+            [article['content'] for article in articles],
+            use_ai=False  # 先用 placeholder，未來可改為 True
         )
+        for article, summary in zip(articles, summaries):
+            article['summary'] = summary
 
-        logger.info(f"處理完成！共 {len(articles)} 篇新聞，Email 發送: {email_status.success}")
+        # Step 4: 寄送 Email（回應送出後才在背景執行，不讓 SMTP 往返拖慢回應）
+        if email_sender.is_configured:
+            logger.info("Step 4: 排入背景寄送 Email...")
+            email_payload = {
+                'keyword': request.keyword,
+                'language': request.language,
+                'date_mode': request.date_mode,
+                'start_date': start_str,
+                'end_date': end_str,
+                'count': request.count
+            }
+            background_tasks.add_task(
+                _send_email_in_background, email_sender, request.email, articles, email_payload
+            )
+            email_status = EmailStatus(success=False, pending=True)
+        else:
+            # SMTP 未設定時不會真的連線，直接回報錯誤
+            email_result = email_sender.send_news_email(request.email, articles, {})
+            email_status = EmailStatus(
+                success=email_result['success'],
+                error=email_result.get('error')
+            )
 
-        return NewsResponse(
-            success=True,
-            message=f"成功處理 {len(articles)} 篇新聞",
-            articles=articles,
-            email_status=email_status,
-            note=note,
-            search_params={
+        logger.info("處理完成！共 %d 篇新聞，Email 背景寄送: %s", len(articles), email_status.pending)
+
+        # 文章由內部程式產生、欄位與 ArticleResponse 一致，直接序列化不再經 pydantic 驗證
+        # 完整正文只在要求時回傳（Email 仍使用完整資料）
+        return ORJSONResponse({
+            'success': True,
+            'message': f"成功處理 {len(articles)} 篇新聞",
+            'articles': [
+                a if request.include_content else {**a, 'content': None}
+                for a in articles
+            ],
+            'email_status': email_status.model_dump(),
+            'note': note,
+            'search_params': {
                 'keyword': request.keyword,
                 'language': request.language,
-                'date_range': f"{start_date.strftime('%Y-%m-%d')} ~ {end_date.strftime('%Y-%m-%d')}",
+                'date_range': f"{start_str} ~ {end_str}",
                 'search_mode': search_mode_used
             }
-        )
+        })
 
     except Exception as e:
-        logger.error(f"處理過程發生錯誤: {str(e)}", exc_info=True)
+        logger.error("處理過程發生錯誤: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"處理過程發生錯誤: {str(e)}")
 
 
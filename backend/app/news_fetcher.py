@@ -2,18 +2,76 @@
 新聞抓取模組 - 使用 Google News RSS
 """
 
+import functools
+import heapq
+import io
 import logging
+import re
 import asyncio
 import aiohttp
 import feedparser
-from datetime import datetime
-from typing import List, Dict, Optional
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse, quote
-import pytz
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from operator import itemgetter
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, urlencode, quote_plus
+from zoneinfo import ZoneInfo
 from dateutil import parser as date_parser
 
+from app.dedup import NearDuplicateTitles, normalize_url
+
 logger = logging.getLogger(__name__)
 
+# 嘗試匯入 lxml（Google News RSS 格式固定，直接用 iterparse 解析比 feedparser 快得多）
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+    logger.warning("lxml 未安裝，RSS 將使用 feedparser 解析")
+
+# 嘗試匯入 selectolax（C 實作的 HTML 解析器，單次走訪即可去除標籤）
+try:
+    from selectolax.parser import HTMLParser as SelectolaxHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+    logger.info("selectolax 未安裝，RSS 摘要將使用正規表示式去除標籤")
+
+TAIPEI_TZ = ZoneInfo('Asia/Taipei')
+
+# 預先編譯的正規表示式
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_parse_date(date_str: str) -> datetime:
+    """
+    解析 RSS 發布時間並補上時區（結果快取，重複抓取時相同的時間字串不再解析）
+    """
+    # RSS 幾乎都是 RFC 822 格式，先用標準庫的快速解析，失敗才用 dateutil
+    try:
+        published = parsedate_to_datetime(date_str)
+    except (TypeError, ValueError):
+        published = date_parser.parse(date_str)
+    # 確保有時區資訊
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    return published
+
+
+def _build_rss_url_templates(base: str, language_config: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+    """
+    預先組好各語言的 RSS URL 樣板，每次查詢只需填入編碼後的關鍵字
+
+    Google News RSS 搜尋格式：/rss/search?q=關鍵字&hl=語言&gl=地區&ceid=地區:語言
+    """
+    return {
+        language: f"{base}?q={{}}&{urlencode(config)}"
+        for language, config in language_config.items()
+    }
+
 
 class NewsFetcher:
     """
@@ -37,14 +95,53 @@ class NewsFetcher:
         }
     }
 
-    # 要移除的 tracking 參數
-    TRACKING_PARAMS = [
-        'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
-        'fbclid', 'gclid', 'msclkid', 'ref', 'source', 'mc_cid', 'mc_eid'
-    ]
+    # 各語言的 RSS URL 樣板（載入時建好，只有關鍵字會變）
+    RSS_URL_TEMPLATES = _build_rss_url_templates(GOOGLE_NEWS_RSS_BASE, LANGUAGE_CONFIG)
 
-    def __init__(self):
-        self.taipei_tz = pytz.timezone('Asia/Taipei')
+    # HTTP 連線設定
+    REQUEST_TIMEOUT = 30  # 秒
+    CONNECTION_LIMIT = 128
+    CONNECTION_LIMIT_PER_HOST = 64
+
+    # RSS 條件式請求快取（以 ETag / Last-Modified 詢問，未變更時直接沿用上次結果）
+    RSS_CACHE_SIZE = 256
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        """
+        Args:
+            session: 外部共用的 aiohttp session（可選，未提供時首次使用時自行建立）
+        """
+        self.timeout = aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
+        # 共用的 HTTP session（外部提供或首次使用時建立，重複利用連線）
+        self._session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
+        # RSS URL -> (ETag, Last-Modified, 解析後的文章)
+        self._rss_cache: Dict[str, Tuple[Optional[str], Optional[str], List[Dict]]] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """取得共用的 aiohttp session，避免每次抓取 RSS 都重新建立連線"""
+        if self._session is None or self._session.closed:
+            self._owns_session = True
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.CONNECTION_LIMIT,
+                    limit_per_host=self.CONNECTION_LIMIT_PER_HOST,
+                    ttl_dns_cache=300
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """關閉自行建立的 HTTP session（外部提供的 session 由提供者負責關閉）"""
+        if self._owns_session and self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def fetch_news(
         self,
@@ -94,11 +191,14 @@ class NewsFetcher:
         # 過濾日期範圍
         filtered_articles = self._filter_by_date(articles, start_date, end_date)
 
-        # 依時間排序（新到舊）
-        sorted_articles = self._sort_by_time(filtered_articles)
-
-        # 限制數量
-        return sorted_articles[:max_count]
+        # 只排出最新的前幾篇再去重（不必整批排序），去重後不足時才擴大範圍
+        take = max_count * 2
+        while True:
+            sorted_articles = self._sort_by_time(filtered_articles, limit=take)
+            unique_articles = self.deduplicate_articles(sorted_articles, limit=max_count)
+            if len(unique_articles) >= max_count or take >= len(filtered_articles):
+                return unique_articles
+            take *= 2
 
     async def _fetch_rss(self, keyword: str, language: str) -> List[Dict]:
         """
@@ -111,40 +211,42 @@ class NewsFetcher:
         Returns:
             解析後的新聞列表
         """
-        config = self.LANGUAGE_CONFIG.get(language, self.LANGUAGE_CONFIG['en-US'])
-
-        # 建構 RSS URL
-        # Google News RSS 搜尋格式：/rss/search?q=關鍵字&hl=語言&gl=地區&ceid=地區:語言
-        params = {
-            'q': keyword,
-            'hl': config['hl'],
-            'gl': config['gl'],
-            'ceid': config['ceid']
-        }
-
-        url = f"{self.GOOGLE_NEWS_RSS_BASE}?{urlencode(params)}"
+        # 建構 RSS URL（樣板已含語言參數，只需填入關鍵字）
+        template = self.RSS_URL_TEMPLATES.get(language, self.RSS_URL_TEMPLATES['en-US'])
+        url = template.format(quote_plus(keyword))
         logger.info(f"抓取 RSS: {url}")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                    if response.status != 200:
-                        logger.error(f"RSS 請求失敗: {response.status}")
-                        return []
-
-                    content = await response.text()
-
-            # 解析 RSS
-            feed = feedparser.parse(content)
-
-            if feed.bozo:
-                logger.warning(f"RSS 解析有警告: {feed.bozo_exception}")
-
-            articles = []
-            for entry in feed.entries:
-                article = self._parse_entry(entry)
-                if article:
-                    articles.append(article)
+            headers = {}
+            cached = self._rss_cache.get(url)
+            if cached:
+                etag, last_modified, _ = cached
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+
+            session = await self._get_session()
+            async with session.get(url, headers=headers, timeout=self.timeout) as response:
+                if response.status == 304 and cached:
+                    # 內容未變更，不必下載與解析（回傳副本，避免呼叫端修改到快取）
+                    logger.info(f"RSS 未變更，使用快取: {language}")
+                    return [dict(article) for article in cached[2]]
+
+                if response.status != 200:
+                    logger.error(f"RSS 請求失敗: {response.status}")
+                    return []
+
+                content = await response.read()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+
+            # 解析 RSS（CPU 密集，移到執行緒執行，讓另一語言的下載可同時進行）
+            articles = await asyncio.to_thread(self._parse_feed, content)
+
+            if etag or last_modified:
+                self._store_rss_cache(url, etag, last_modified, articles)
+                articles = [dict(article) for article in articles]
 
             logger.info(f"從 {language} RSS 解析到 {len(articles)} 篇文章")
             return articles
@@ -156,24 +258,118 @@ class NewsFetcher:
             logger.error(f"抓取 RSS 發生錯誤: {e}")
             return []
 
+    def _store_rss_cache(
+        self,
+        url: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        articles: List[Dict]
+    ):
+        """
+        記錄 RSS 的驗證標頭與解析結果，超過上限時移除最早加入的項目
+        """
+        self._rss_cache.pop(url, None)
+        if len(self._rss_cache) >= self.RSS_CACHE_SIZE:
+            self._rss_cache.pop(next(iter(self._rss_cache)))
+        self._rss_cache[url] = (etag, last_modified, articles)
+
+    def _parse_feed(self, content: bytes) -> List[Dict]:
+        """
+        解析 RSS 內容為文章列表
+
+        優先使用 lxml iterparse，XML 格式有誤或未安裝 lxml 時改用較寬鬆的 feedparser
+        """
+        if LXML_AVAILABLE:
+            try:
+                return self._parse_feed_lxml(content)
+            except etree.XMLSyntaxError as e:
+                logger.warning(f"RSS XML 格式有誤，改用 feedparser: {e}")
+
+        # Google News 的標題與連結不需要 HTML 消毒與相對網址解析，關閉以省去最耗時的步驟
+        feed = feedparser.parse(content, sanitize_html=False, resolve_relative_uris=False)
+
+        if feed.bozo:
+            logger.warning(f"RSS 解析有警告: {feed.bozo_exception}")
+
+        articles = []
+        for entry in feed.entries:
+            article = self._parse_entry(entry)
+            if article:
+                articles.append(article)
+        return articles
+
+    def _parse_feed_lxml(self, content: bytes) -> List[Dict]:
+        """
+        以 lxml iterparse 逐一解析 <item>，處理完即釋放節點，記憶體用量固定
+        """
+        articles = []
+        for _, item in etree.iterparse(io.BytesIO(content), events=('end',), tag='item'):
+            # 直接讀取已知欄位，不經過中介結構
+            source = item.find('source')
+            article = self._build_article(
+                title=item.findtext('title') or '',
+                link=(item.findtext('link') or '').strip(),
+                published_str=item.findtext('pubDate'),
+                source_name=source.text if source is not None else None,
+                summary_html=item.findtext('description')
+            )
+            if article:
+                articles.append(article)
+
+            # 釋放已處理的節點
+            item.clear()
+            while item.getprevious() is not None:
+                del item.getparent()[0]
+
+        return articles
+
     def _parse_entry(self, entry) -> Optional[Dict]:
         """
-        解析單一 RSS entry
+        解析單一 RSS entry（feedparser 解析時使用）
 
         Args:
             entry: feedparser entry 物件
 
+        Returns:
+            解析後的文章資訊
+        """
+        source = entry.get('source')
+        return self._build_article(
+            title=entry.get('title', ''),
+            link=entry.get('link', ''),
+            published_str=entry.get('published') or entry.get('updated'),
+            source_name=source.get('title') if source else None,
+            summary_html=entry.get('summary')
+        )
+
+    def _build_article(
+        self,
+        title: str,
+        link: str,
+        published_str: Optional[str],
+        source_name: Optional[str],
+        summary_html: Optional[str]
+    ) -> Optional[Dict]:
+        """
+        由 RSS item 的各欄位組成文章資訊
+
+        Args:
+            title: 標題（Google News 通常以「 - 來源」結尾）
+            link: 連結
+            published_str: 發布時間字串
+            source_name: <source> 欄位的來源名稱
+            summary_html: 摘要 HTML
+
         Returns:
             解析後的文章資訊
         """
         try:
             # 標題
-            title = entry.get('title', '').strip()
+            title = title.strip()
             if not title:
                 return None
 
             # 連結 - Google News RSS 的連結通常是 Google 轉址
-            link = entry.get('link', '')
             if not link:
                 return None
 
@@ -182,32 +378,27 @@ class NewsFetcher:
 
             # 來源 - Google News RSS 通常在標題後有來源
             source = ''
-            if ' - ' in title:
-                parts = title.rsplit(' - ', 1)
-                if len(parts) == 2:
-                    title = parts[0].strip()
-                    source = parts[1].strip()
+            head, sep, tail = title.rpartition(' - ')
+            if sep:
+                title = head.strip()
+                source = tail.strip()
 
             # 也可以從 source 欄位取得
-            if not source and hasattr(entry, 'source'):
-                source = entry.source.get('title', '')
+            if not source and source_name:
+                source = source_name
 
             # 發布時間
             published = None
-            published_str = entry.get('published') or entry.get('updated')
             if published_str:
                 try:
-                    published = date_parser.parse(published_str)
-                    # 確保有時區資訊
-                    if published.tzinfo is None:
-                        published = pytz.UTC.localize(published)
+                    published = _cached_parse_date(published_str)
                 except Exception as e:
                     logger.debug(f"解析時間失敗: {published_str}, {e}")
 
             # 摘要（RSS 自帶的）
             summary = ''
-            if hasattr(entry, 'summary'):
-                summary = self._clean_html(entry.summary)
+            if summary_html:
+                summary = self._clean_html(summary_html)
 
             return {
                 'title': title,
@@ -216,6 +407,7 @@ class NewsFetcher:
                 'source': source,
                 'published': published.isoformat() if published else None,
                 'published_dt': published,
+                'published_ts': published.timestamp() if published else None,  # 排序與過濾用
                 'summary': summary
             }
 
@@ -257,11 +449,13 @@ class NewsFetcher:
         """
         清理 HTML 標籤，只保留純文字
         """
-        import re
-        # 移除 HTML 標籤
-        clean = re.sub(r'<[^>]+>', '', html_text)
+        # 移除 HTML 標籤（同時解碼 &nbsp; 等實體）
+        if SELECTOLAX_AVAILABLE:
+            clean = SelectolaxHTMLParser(html_text).text(separator=' ')
+        else:
+            clean = _TAG_RE.sub('', html_text)
         # 清理多餘空白
-        clean = re.sub(r'\s+', ' ', clean).strip()
+        clean = _WS_RE.sub(' ', clean).strip()
         return clean
 
     def _filter_by_date(
@@ -283,27 +477,26 @@ class NewsFetcher:
         """
         filtered = []
 
+        # 範圍邊界只計算一次（沒有時區的日期視為台北時間），轉成 epoch 秒數直接比較
+        start_ts = (start_date if start_date.tzinfo else start_date.replace(tzinfo=TAIPEI_TZ)).timestamp()
+        end_ts = (end_date if end_date.tzinfo else end_date.replace(tzinfo=TAIPEI_TZ)).timestamp()
+
         for article in articles:
-            pub_dt = article.get('published_dt')
+            pub_ts = article.get('published_ts')
 
-            if pub_dt is None:
+            if pub_ts is None:
                 # 如果沒有時間，預設包含（放寬條件）
                 # TODO: 可以改成排除沒有時間的文章
                 filtered.append(article)
                 continue
 
-            # 轉換到台北時區比較
-            pub_taipei = pub_dt.astimezone(self.taipei_tz)
-            start_taipei = start_date.astimezone(self.taipei_tz) if start_date.tzinfo else self.taipei_tz.localize(start_date)
-            end_taipei = end_date.astimezone(self.taipei_tz) if end_date.tzinfo else self.taipei_tz.localize(end_date)
-
-            if start_taipei <= pub_taipei <= end_taipei:
+            if start_ts <= pub_ts <= end_ts:
                 filtered.append(article)
 
         logger.info(f"日期過濾: {len(articles)} -> {len(filtered)} 篇")
         return filtered
 
-    def _sort_by_time(self, articles: List[Dict]) -> List[Dict]:
+    def _sort_by_time(self, articles: List[Dict], limit: Optional[int] = None) -> List[Dict]:
         """
         依時間排序（新到舊）
 
@@ -311,86 +504,51 @@ class NewsFetcher:
 
         Args:
             articles: 文章列表
+            limit: 只需要最新的前幾篇（可選，以 heap 取出，不做完整排序）
 
         Returns:
             排序後的文章列表
         """
-        def sort_key(article):
-            pub_dt = article.get('published_dt')
-            if pub_dt is None:
-                # 沒有時間的排在最後
-                return datetime.min.replace(tzinfo=pytz.UTC)
-            return pub_dt
+        # 有時間的以 C 實作的 itemgetter 排序，沒有時間的維持原順序排在最後
+        dated = [article for article in articles if article.get('published_ts') is not None]
+        if limit is not None and limit < len(dated):
+            return heapq.nlargest(limit, dated, key=itemgetter('published_ts'))
 
-        return sorted(articles, key=sort_key, reverse=True)
+        undated = [article for article in articles if article.get('published_ts') is None]
+        dated.sort(key=itemgetter('published_ts'), reverse=True)
+        return (dated + undated)[:limit]
 
-    def deduplicate_articles(self, articles: List[Dict]) -> List[Dict]:
+    def deduplicate_articles(self, articles: List[Dict], limit: Optional[int] = None) -> List[Dict]:
         """
         文章去重
 
-        目前實作 URL 去重，標題相似度去重為 TODO
+        先以正規化 URL 去重，再以 SimHash 排除標題相近的同一則新聞（保留較前面的文章）
 
         Args:
             articles: 文章列表
+            limit: 最多保留篇數（可選，湊滿即停止走訪）
 
         Returns:
             去重後的文章列表
         """
         seen_urls = set()
+        titles = NearDuplicateTitles()
         unique_articles = []
 
         for article in articles:
             # 正規化 URL
-            normalized_url = self._normalize_url(article['url'])
+            normalized_url = normalize_url(article['url'])
+            if normalized_url in seen_urls:
+                continue
+            seen_urls.add(normalized_url)
 
-            if normalized_url not in seen_urls:
-                seen_urls.add(normalized_url)
-                unique_articles.append(article)
+            # 標題相近（不同網址轉載同一則新聞）
+            if titles.is_duplicate(article.get('title', ''), article.get('published_ts')):
+                continue
 
-        # TODO: 標題相似度去重
-        # 可使用 difflib.SequenceMatcher 或更進階的文字相似度演算法
-        # 例如：
-        # from difflib import SequenceMatcher
-        # def similar(a, b):
-        #     return SequenceMatcher(None, a, b).ratio()
-        # 若兩篇文章標題相似度 > 0.8，視為重複
+            unique_articles.append(article)
+            if limit is not None and len(unique_articles) >= limit:
+                break
 
-        logger.info(f"URL 去重: {len(articles)} -> {len(unique_articles)} 篇")
+        logger.info(f"去重: {len(articles)} -> {len(unique_articles)} 篇")
         return unique_articles
-
-    def _normalize_url(self, url: str) -> str:
-        """
-        正規化 URL，移除 tracking 參數
-
-        Args:
-            url: 原始 URL
-
-        Returns:
-            正規化後的 URL
-        """
-        try:
-            parsed = urlparse(url)
-            query_params = parse_qs(parsed.query)
-
-            # 移除 tracking 參數
-            cleaned_params = {
-                k: v for k, v in query_params.items()
-                if k.lower() not in self.TRACKING_PARAMS
-            }
-
-            # 重建 URL
-            cleaned_query = urlencode(cleaned_params, doseq=True) if cleaned_params else ''
-            normalized = urlunparse((
-                parsed.scheme,
-                parsed.netloc.lower(),
-                parsed.path.rstrip('/'),
-                parsed.params,
-                cleaned_query,
-                ''  # 移除 fragment
-            ))
-
-            return normalized
-
-        except Exception as e:
-            logger.debug(f"URL 正規化失敗: {url}, {e}")
-            return url.lower()
@@ -3,10 +3,15 @@
 提供 placeholder 摘要與 AI 摘要介面
 """
 
+import asyncio
+import hashlib
 import logging
 import os
 import re
-from typing import Optional
+import threading
+from typing import List, Optional
+
+from app.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +19,25 @@ logger = logging.getLogger(__name__)
 AI_API_KEY = os.getenv('AI_API_KEY', '')
 AI_API_URL = os.getenv('AI_API_URL', '')
 
+# 預先編譯的正規表示式
+_WS_RE = re.compile(r'\s+')
+_CTRL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# 句子結尾字元：全形標點直接視為結尾，半形標點需後接空格
+_CJK_SENTENCE_ENDINGS = frozenset('。！？')
+_ASCII_SENTENCE_ENDINGS = frozenset('.!?')
+
+# AI 摘要結果（跨請求共用，以正文雜湊為 key，重複的文章不再呼叫 AI API）
+_ai_summary_cache = LRUCache(maxsize=1024)
+_ai_summary_cache_lock = threading.Lock()
+
+
+def _summary_cache_key(text: str) -> bytes:
+    """
+    AI 摘要快取用的 key（清理後正文的 blake2b 雜湊）
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
 
 class Summarizer:
     """
@@ -52,6 +76,9 @@ class Summarizer:
     SUMMARY_MIN_LENGTH = 450
     SUMMARY_MAX_LENGTH = 600
 
+    # 批次摘要同時進行的數量
+    BATCH_CONCURRENCY = 8
+
     def __init__(self):
         self.ai_enabled = bool(AI_API_KEY and AI_API_URL)
         if self.ai_enabled:
@@ -78,7 +105,7 @@ class Summarizer:
 
         # 使用 AI 摘要（如果啟用且要求）
         if use_ai and self.ai_enabled:
-            ai_summary = self._summarize_with_ai(cleaned_text)
+            ai_summary = self._cached_ai_summary(cleaned_text)
             if ai_summary:
                 return ai_summary
             logger.warning("AI 摘要失敗，改用 Placeholder")
@@ -86,6 +113,36 @@ class Summarizer:
         # 使用 Placeholder 摘要
         return self._create_placeholder_summary(cleaned_text)
 
+    async def summarize_batch(
+        self,
+        texts: List[str],
+        use_ai: bool = False,
+        concurrency: Optional[int] = None
+    ) -> List[str]:
+        """
+        批次產生多篇文章摘要
+
+        各篇摘要在執行緒中同時進行（以 semaphore 限制數量），
+        AI 摘要時總延遲約為一次往返而非 N 次。
+        若日後使用支援批次輸入的 API（如 Hugging Face 的 inputs=[...]），
+        可在此改為單一請求送出。
+
+        Args:
+            texts: 文章正文列表
+            use_ai: 是否使用 AI 摘要（預設 False）
+            concurrency: 同時進行的數量（預設 BATCH_CONCURRENCY）
+
+        Returns:
+            摘要列表，順序與 texts 相同
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.BATCH_CONCURRENCY)
+
+        async def summarize_one(text: str) -> str:
+            async with semaphore:
+                return await asyncio.to_thread(self.summarize, text, use_ai)
+
+        return await asyncio.gather(*(summarize_one(text) for text in texts))
+
     def _clean_text(self, text: str) -> str:
         """
         清理文字
@@ -93,10 +150,10 @@ class Summarizer:
         移除多餘空白、特殊字元等
         """
         # 移除多餘空白和換行
-        text = re.sub(r'\s+', ' ', text)
+        text = _WS_RE.sub(' ', text)
 
         # 移除特殊控制字元
-        text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', text)
+        text = _CTRL_RE.sub('', text)
 
         return text.strip()
 
@@ -116,21 +173,16 @@ class Summarizer:
         summary = text[:self.SUMMARY_MAX_LENGTH]
 
         # 嘗試在句子結尾處截斷
-        # 尋找最後一個句號、問號、驚嘆號
-        sentence_endings = [
-            summary.rfind('。'),
-            summary.rfind('！'),
-            summary.rfind('？'),
-            summary.rfind('. '),
-            summary.rfind('! '),
-            summary.rfind('? '),
-        ]
-
-        # 找到最後一個句子結尾（至少要有 450 字）
+        # 由尾端往回掃描，遇到第一個句子結尾即停止（至少要有 450 字）
         best_end = -1
-        for end in sentence_endings:
-            if end > self.SUMMARY_MIN_LENGTH and end > best_end:
-                best_end = end
+        last = len(summary) - 1
+        for i in range(last, self.SUMMARY_MIN_LENGTH, -1):
+            char = summary[i]
+            if char in _CJK_SENTENCE_ENDINGS or (
+                char in _ASCII_SENTENCE_ENDINGS and i < last and summary[i + 1] == ' '
+            ):
+                best_end = i
+                break
 
         if best_end > 0:
             summary = summary[:best_end + 1]
@@ -146,6 +198,23 @@ class Summarizer:
 
         return summary
 
+    def _cached_ai_summary(self, text: str) -> Optional[str]:
+        """
+        取得 AI 摘要，相同正文直接使用快取結果（只快取成功的摘要）
+        """
+        key = _summary_cache_key(text)
+        with _ai_summary_cache_lock:
+            summary = _ai_summary_cache.get(key)
+        if summary is not None:
+            logger.info("使用快取的 AI 摘要")
+            return summary
+
+        summary = self._summarize_with_ai(text)
+        if summary:
+            with _ai_summary_cache_lock:
+                _ai_summary_cache.set(key, summary)
+        return summary
+
     def _summarize_with_ai(self, text: str) -> Optional[str]:
         """
         使用 AI API 產生摘要
@@ -168,6 +237,7 @@ class Summarizer:
             # ========================================
 
             # 範例: Hugging Face Inference API
+            # import orjson
             # import requests
             #
             # headers = {"Authorization": f"Bearer {AI_API_KEY}"}
@@ -175,7 +245,7 @@ class Summarizer:
             #
             # response = requests.post(AI_API_URL, headers=headers, json=payload)
             # if response.status_code == 200:
-            #     result = response.json()
+            #     result = orjson.loads(response.content)  # 比 response.json() 快
             #     return result[0].get('summary_text', '')
 
             # 範例: OpenAI API
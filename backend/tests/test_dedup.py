@@ -0,0 +1,24 @@
+"""
+去重工具測試
+"""
+
+from app.dedup import NearDuplicateTitles, title_simhash
+
+
+def test_title_simhash_is_stable():
+    """SimHash 不受 PYTHONHASHSEED 影響，重啟後同一標題得到相同的值"""
+    assert title_simhash('台積電宣布擴大在美投資') == 1410807200049310730
+    assert title_simhash('Story number 7 about topic & things') == title_simhash('story NUMBER 7 about topic things')
+
+
+def test_title_simhash_empty():
+    """只有空白或標點的標題沒有特徵"""
+    assert title_simhash(' - !') == 0
+
+
+def test_near_duplicate_titles():
+    """相近標題在一天內視為重複，不同標題則否"""
+    titles = NearDuplicateTitles()
+    assert not titles.is_duplicate('台積電宣布擴大在美投資 AI 晶片需求強勁', 0)
+    assert titles.is_duplicate('台積電宣布擴大在美投資AI晶片需求強勁！', 60)
+    assert not titles.is_duplicate('完全不同的新聞標題內容', 0)
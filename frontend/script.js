@@ -58,7 +58,8 @@ newsForm.addEventListener('submit', async function(e) {
         count: parseInt(document.getElementById('count').value),
         date_mode: document.querySelector('input[name="dateMode"]:checked').value,
         email: document.getElementById('email').value.trim(),
-        search_mode: document.querySelector('input[name="searchMode"]:checked').value
+        search_mode: document.querySelector('input[name="searchMode"]:checked').value,
+        include_content: true  // 結果頁面需要顯示完整正文
     };
 
     // 如果是自訂日期範圍
@@ -167,6 +168,9 @@ function handleSuccess(result, formData) {
     if (emailStatus && emailStatus.success) {
         showStatus('success', '✅', '處理完成，郵件已發送！',
             `成功抓取 ${articles.length} 篇新聞，已寄送至 ${formData.email}`);
+    } else if (emailStatus && emailStatus.pending) {
+        showStatus('success', '✅', '處理完成，郵件寄送中！',
+            `成功抓取 ${articles.length} 篇新聞，正在寄送至 ${formData.email}`);
     } else if (articles.length > 0) {
         const emailError = emailStatus ? emailStatus.error : '未知錯誤';
         showStatus('warning', '⚠️', '新聞抓取成功，但郵件發送失敗',